@@ -0,0 +1,48 @@
+"""Import time of :mod:`agent.tally_agent`, measured in fresh interpreters.
+
+The runtime defers LangChain and the OpenAI client until the LLM is first
+needed. This compares importing the module with also building the chain,
+which is roughly what every import cost when it was built eagerly.
+
+    python -m agent.bench_import
+    python -m agent.bench_import --runs 10
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CASES = {
+    "import agent.tally_agent": "import agent.tally_agent",
+    "import + build LLM chain": "import agent.tally_agent as m; m.runtime.chain",
+}
+
+
+def measure(code: str) -> float:
+    """Seconds spent running ``code`` in a new interpreter, excluding its startup."""
+    timed = f"import time; t = time.perf_counter(); {code}; print(time.perf_counter() - t)"
+    # The chain only needs a key to be constructed, never to be called here
+    env = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "unused")}
+    out = subprocess.run(
+        [sys.executable, "-c", timed], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.split()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, code in CASES.items():
+        times = [measure(code) for _ in range(args.runs)]
+        print(f"{name:26} median {statistics.median(times) * 1e3:7.1f} ms, min {min(times) * 1e3:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Coverage and accuracy of the rule-based intent parser on a labeled corpus.
+
+Each line of ``intent_corpus.jsonl`` holds a command and the intent it should
+produce; ``expected`` is null for commands the rules are not meant to handle.
+Relative dates are resolved against a fixed day so the labels stay valid.
+With ``--llm`` every command the fast path answers is also sent to the model
+and the two answers are compared.
+
+    python -m agent.bench_intent
+    python -m agent.bench_intent --sweep
+    python -m agent.bench_intent --llm
+"""
+
+import argparse
+import json
+import re
+import time
+from datetime import date
+from pathlib import Path
+
+from .utils.dates import resolve_relative_dates
+from .utils.intent import parse_intent
+
+CORPUS = Path(__file__).with_name("intent_corpus.jsonl")
+TODAY = date(2026, 10, 18)
+
+
+def key_fields(intent) -> tuple:
+    """The parts of an intent that decide what is fetched from Tally."""
+    if not isinstance(intent, dict):
+        return (None,)
+    params = intent.get("parameters") or {}
+    dates = params.get("date_range") or {}
+    filters = params.get("filters") or {}
+    return (
+        (intent.get("root_task") or "").casefold(),
+        (intent.get("sub_task") or "").casefold(),
+        dates.get("from") or None,
+        dates.get("to") or None,
+        (filters.get("party") or "").casefold() or None,
+        (params.get("company") or "").casefold() or None,
+    )
+
+
+def parse_llm_output(text: str):
+    # Models often wrap the JSON in a fenced block
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    try:
+        return json.loads(match.group(0)) if match else None
+    except ValueError:
+        return None
+
+
+def load(path: Path = CORPUS) -> list:
+    return [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+
+
+def evaluate(rows: list) -> list:
+    """Return ``(row, text, intent, confidence, correct)`` for each command.
+
+    ``correct`` is None when the rules give no answer.
+    """
+    results = []
+    for row in rows:
+        text = resolve_relative_dates(row["text"], TODAY)
+        intent, confidence = parse_intent(text)
+        correct = None
+        if intent is not None:
+            correct = row["expected"] is not None and key_fields(intent) == key_fields(row["expected"])
+        results.append((row, text, intent, confidence, correct))
+    return results
+
+
+def at_threshold(results: list, threshold: float) -> dict:
+    """Answered, correct and wrong counts if answers below ``threshold`` go to the LLM."""
+    answered = [r for r in results if r[2] is not None and r[3] >= threshold]
+    correct = sum(bool(r[4]) for r in answered)
+    return {"answered": len(answered), "correct": correct, "wrong": len(answered) - correct}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--threshold", type=float, default=0.75)
+    parser.add_argument("--llm", action="store_true", help="compare fast-path answers with the model")
+    parser.add_argument("--sweep", action="store_true", help="precision and coverage at several thresholds")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    rows = load(args.corpus)
+    answered = correct = wrong_scope = 0
+    covered = []
+    start = time.perf_counter()
+    results = evaluate(rows)
+    elapsed = time.perf_counter() - start
+    for row, text, intent, confidence, ok in results:
+        if intent is None or confidence < args.threshold:
+            if args.verbose:
+                print(f"  LLM   {row['text']}")
+            continue
+        answered += 1
+        covered.append((text, intent))
+        if row["expected"] is None:
+            wrong_scope += 1
+        correct += ok
+        if args.verbose or not ok:
+            print(f"  {'ok  ' if ok else 'FAIL'}  {row['text']} -> {json.dumps(intent)}")
+
+    in_scope = sum(row["expected"] is not None for row in rows)
+    print(f"commands                {len(rows)} ({in_scope} in scope)")
+    print(f"fast-path coverage      {answered / len(rows):6.1%} of all, {(answered - wrong_scope) / in_scope:6.1%} of in scope")
+    print(f"fast-path accuracy      {correct / answered if answered else 0:6.1%} ({correct}/{answered})")
+    print(f"answered out of scope   {wrong_scope}")
+    print(f"time per command        {elapsed / len(rows) * 1e6:6.1f} µs (incl. date resolution)")
+
+    if args.sweep:
+        print("threshold  answered  correct  wrong  in-scope coverage")
+        for threshold in (0.1, 0.4, 0.7, 1.0):
+            counts = at_threshold(results, threshold)
+            print(
+                f"{threshold:9.2f}  {counts['answered']:8}  {counts['correct']:7}  {counts['wrong']:5}"
+                f"  {counts['correct'] / in_scope:17.1%}"
+            )
+
+    if args.llm and covered:
+        from .tally_agent import runtime
+
+        agree = 0
+        start = time.perf_counter()
+        for text, intent in covered:
+            result = runtime.chain.invoke({"user_input": text})
+            llm_intent = parse_llm_output(getattr(result, "content", result))
+            same = key_fields(llm_intent) == key_fields(intent)
+            agree += same
+            if not same:
+                print(f"  differ  {text}\n    fast: {json.dumps(intent)}\n    llm:  {json.dumps(llm_intent)}")
+        elapsed = time.perf_counter() - start
+        print(f"agreement with LLM      {agree / len(covered):6.1%} ({agree}/{len(covered)})")
+        print(f"LLM time per command    {elapsed / len(covered) * 1e3:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,23 @@
 """Utility for syncing Tally data with the backend service."""
 
 import argparse
+import io
+import itertools
+import json
 import os
-from typing import Iterable
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import xml.etree.ElementTree as ET
 
 import requests
 from dotenv import load_dotenv
 
 from tally_tool import main as tally
+from tally_tool.xml_extractor import iter_elements, iter_ledgers, iter_vouchers, strip_invalid_char_refs
 
 
 load_dotenv()
@@ -15,45 +25,312 @@ load_dotenv()
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 CLIENT_ID = os.getenv("CLIENT_ID", "demo")
 CLIENT_TOKEN = os.getenv("CLIENT_TOKEN")
+SYNC_CHECKPOINT = os.getenv(
+    "SYNC_CHECKPOINT", str(Path(__file__).parent / "sync_checkpoint.json")
+)
+SYNC_STATE = os.getenv("SYNC_STATE", str(Path(__file__).parent / "sync_state.json"))
 
+# Data types whose Tally export can be split by date range
+WINDOWED_FETCHERS: dict[str, Callable[[str, str], str]] = {
+    "vouchers": lambda f, t: tally.get_vouchers("All", f, t),
+    "daybook": tally.get_day_book,
+}
 
-def backend_post(route: str, data: dict) -> requests.Response:
-    """POST helper that adds the authentication header."""
+
+def _auth_headers() -> dict[str, str]:
     headers: dict[str, str] = {}
     if CLIENT_TOKEN:
         headers["Authorization"] = f"Bearer {CLIENT_TOKEN}"
-    resp = requests.post(f"{BACKEND_URL}{route}", data=data, headers=headers)
+    return headers
+
+
+def backend_post(route: str, data: dict) -> requests.Response:
+    """POST helper that adds the authentication header."""
+    resp = requests.post(f"{BACKEND_URL}{route}", data=data, headers=_auth_headers())
     resp.raise_for_status()
     return resp
 
 
-def sync_data(types: Iterable[str], from_date: str, to_date: str, voucher_no: str | None = None) -> None:
-    """Sequentially fetch the requested data and upload to the backend."""
+def _gzip_ndjson(vouchers: Iterable[ET.Element]) -> Iterator[bytes]:
+    """Encode vouchers as gzip-compressed NDJSON, one chunk at a time."""
+    compressor = zlib.compressobj(wbits=31)
+    for elem in vouchers:
+        line = json.dumps({"data_type": "xml", "payload": ET.tostring(elem, encoding="unicode")})
+        chunk = compressor.compress(line.encode() + b"\n")
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def _post_whole(payload: str) -> dict:
+    return backend_post(
+        "/upload_voucher",
+        {
+            "client_id": CLIENT_ID,
+            "data_type": "xml",
+            "payload": payload,
+        },
+    ).json()
+
+
+def upload_payload(payload: str) -> dict:
+    """Upload a Tally export, streaming its vouchers to the bulk endpoint.
+
+    Character references Tally emits but XML forbids (``&#4;``) are removed
+    first. Exports without ``VOUCHER`` elements (ledgers, outstanding
+    reports) or that cannot be parsed are posted whole to ``/upload_voucher``
+    instead, as are exports that turn out to be malformed part way through.
+    """
+    payload = strip_invalid_char_refs(payload)
+    vouchers = iter_elements(io.StringIO(payload), "VOUCHER")
+    try:
+        first = next(vouchers, None)
+    except ET.ParseError:
+        first = None
+    if first is None:
+        return _post_whole(payload)
+
+    headers = _auth_headers()
+    headers["Content-Type"] = "application/x-ndjson"
+    headers["Content-Encoding"] = "gzip"
+    try:
+        resp = requests.post(
+            f"{BACKEND_URL}/upload_vouchers",
+            data=_gzip_ndjson(itertools.chain([first], vouchers)),
+            headers=headers,
+        )
+    except ET.ParseError:
+        # Vouchers streamed before the error are upserted again, not duplicated
+        return _post_whole(payload)
+    resp.raise_for_status()
+    result = resp.json()
+    if result.get("error"):
+        print(f"{result['error']} of {result['received']} vouchers could not be stored")
+    return result
+
+
+class Watermarks:
+    """Per client and data type high-water marks persisted as JSON.
+
+    Each mark holds the highest Tally ``alter_id`` seen in a successful
+    upload, plus the latest voucher ``date`` (YYYYMMDD) as a fallback for
+    exports that carry no AlterID.
+    """
+
+    def __init__(self, path: str, client_id: str) -> None:
+        self.path = Path(path)
+        self.client_id = client_id
+        self._state: dict[str, dict[str, dict]] = {}
+        if self.path.exists():
+            self._state = json.loads(self.path.read_text())
+
+    def get(self, dtype: str) -> dict:
+        return self._state.get(self.client_id, {}).get(dtype, {})
+
+    def advance(self, dtype: str, date: Optional[str], alter_id: Optional[int]) -> None:
+        """Move the mark forward, never backwards, and persist it."""
+        mark = dict(self.get(dtype))
+        if date and date > mark.get("date", ""):
+            mark["date"] = date
+        if alter_id and alter_id > mark.get("alter_id", 0):
+            mark["alter_id"] = alter_id
+        self._state.setdefault(self.client_id, {})[dtype] = mark
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._state, indent=2))
+        tmp.replace(self.path)
+
+
+def _high_water(records: Iterable[dict]) -> Tuple[Optional[str], Optional[int]]:
+    """Return the latest date and highest AlterID in ``records``."""
+    max_date, max_alter = None, None
+    for rec in records:
+        if rec.get("date") and (max_date is None or rec["date"] > max_date):
+            max_date = rec["date"]
+        if rec.get("alter_id") and rec["alter_id"].isdigit():
+            alter = int(rec["alter_id"])
+            max_alter = alter if max_alter is None else max(max_alter, alter)
+    return max_date, max_alter
 
+
+def sync_data(
+    types: Iterable[str],
+    from_date: str,
+    to_date: str,
+    voucher_no: str | None = None,
+    watermarks: Watermarks | None = None,
+) -> List[str]:
+    """Sequentially fetch the requested data and upload to the backend.
+
+    When ``watermarks`` is given, only records whose AlterID is above the
+    last synced one are exported, so back-dated edits are picked up too.
+    Until an AlterID has been seen, voucher exports start from the last synced
+    date instead. The backend upserts vouchers by natural key, so records
+    sent twice do not create duplicates.
+
+    A type whose fetch or upload fails is reported and skipped, leaving its
+    watermark in place. Returns the types that failed.
+    """
+
+    failed = []
     for dtype in types:
         dtype = dtype.strip().lower()
-        if dtype == "ledgers":
-            payload = tally.get_ledgers()
-        elif dtype == "vouchers":
-            payload = tally.get_vouchers("All")
-        elif dtype == "specific_voucher" and voucher_no:
-            payload = tally.get_specific_voucher(voucher_no)
-        elif dtype == "outstanding":
-            payload = tally.get_outstanding_receivables(from_date, to_date)
-        elif dtype == "daybook":
-            payload = tally.get_day_book(from_date, to_date)
-        else:
-            # Unknown or improperly configured type
+        mark = watermarks.get(dtype) if watermarks else {}
+        start = from_date
+        if mark.get("date") and (
+            not from_date or _parse_date(from_date).strftime("%Y%m%d") < mark["date"]
+        ):
+            start = mark["date"]
+        extract = iter_vouchers
+        try:
+            if dtype == "ledgers":
+                payload = tally.get_ledgers(mark.get("alter_id"))
+                extract = iter_ledgers
+            elif dtype in ("vouchers", "daybook") and mark.get("alter_id"):
+                payload = tally.get_vouchers_altered_since(
+                    mark["alter_id"], from_date or None, to_date or None
+                )
+            elif dtype == "vouchers":
+                payload = tally.get_vouchers("All", start or None, to_date or None)
+            elif dtype == "specific_voucher" and voucher_no:
+                payload = tally.get_specific_voucher(voucher_no)
+            elif dtype == "outstanding":
+                payload = tally.get_outstanding_receivables(from_date, to_date)
+            elif dtype == "daybook":
+                payload = tally.get_day_book(start, to_date)
+            else:
+                # Unknown or improperly configured type
+                continue
+
+            payload = strip_invalid_char_refs(payload)
+            upload_payload(payload)
+        except (requests.RequestException, ET.ParseError) as exc:
+            print(f"Sync of {dtype} failed: {exc}")
+            failed.append(dtype)
             continue
 
-        backend_post(
-            "/upload_voucher",
-            {
-                "client_id": CLIENT_ID,
-                "data_type": "xml",
-                "payload": payload,
-            },
-        )
+        if watermarks and dtype in ("ledgers", "vouchers", "daybook"):
+            try:
+                last_date, alter_id = _high_water(extract(io.StringIO(payload)))
+            except ET.ParseError:
+                # Leave the mark where it was; the next run refetches the range
+                continue
+            watermarks.advance(dtype, last_date, alter_id)
+    return failed
+
+
+def _parse_date(value: str) -> date:
+    """Parse a Tally (YYYYMMDD) or ISO (YYYY-MM-DD) date."""
+    for fmt in ("%Y%m%d", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date: {value!r}")
+
+
+def date_windows(from_date: str, to_date: str, window: str) -> List[Tuple[str, str]]:
+    """Split an inclusive date range into Tally formatted windows.
+
+    ``window`` is ``"month"``, ``"week"`` or a number of days.
+    """
+    start, end = _parse_date(from_date), _parse_date(to_date)
+    windows = []
+    while start <= end:
+        if window == "month":
+            next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+            stop = next_month - timedelta(days=1)
+        elif window == "week":
+            stop = start + timedelta(days=6)
+        else:
+            stop = start + timedelta(days=int(window) - 1)
+        stop = min(stop, end)
+        windows.append((start.strftime("%Y%m%d"), stop.strftime("%Y%m%d")))
+        start = stop + timedelta(days=1)
+    return windows
+
+
+class Checkpoint:
+    """JSON file recording which sync windows have been uploaded."""
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.done: set[str] = set()
+        if self.path.exists():
+            self.done = set(json.loads(self.path.read_text()))
+
+    @staticmethod
+    def key(dtype: str, from_date: str, to_date: str) -> str:
+        return f"{dtype}:{from_date}:{to_date}"
+
+    def mark_done(self, key: str) -> None:
+        with self._lock:
+            self.done.add(key)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(sorted(self.done)))
+            tmp.replace(self.path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.done.clear()
+            self.path.unlink(missing_ok=True)
+
+
+def _sync_window(dtype: str, from_date: str, to_date: str) -> None:
+    upload_payload(WINDOWED_FETCHERS[dtype](from_date, to_date))
+
+
+def sync_windowed(
+    types: Iterable[str],
+    from_date: str,
+    to_date: str,
+    window: str = "month",
+    workers: int = 4,
+    checkpoint_path: str = SYNC_CHECKPOINT,
+    voucher_no: str | None = None,
+) -> List[str]:
+    """Fetch and upload date-ranged data in concurrent windows.
+
+    Each window is uploaded as soon as it has been fetched and recorded in the
+    checkpoint file, so an interrupted run resumes with the windows that are
+    still missing. Types that cannot be split by date are synced as usual,
+    ``specific_voucher`` with ``voucher_no``.
+    Returns the names of those types and the keys of the windows that failed.
+    """
+    types = [t.strip().lower() for t in types]
+    failed_types = sync_data(
+        [t for t in types if t not in WINDOWED_FETCHERS], from_date, to_date, voucher_no
+    )
+
+    checkpoint = Checkpoint(checkpoint_path)
+    jobs = [
+        (dtype, f, t)
+        for dtype in types
+        if dtype in WINDOWED_FETCHERS
+        for f, t in date_windows(from_date, to_date, window)
+        if Checkpoint.key(dtype, f, t) not in checkpoint.done
+    ]
+
+    failed = []
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(_sync_window, *job): Checkpoint.key(*job) for job in jobs}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                future.result()
+            except (requests.RequestException, ValueError, ET.ParseError) as exc:
+                print(f"Sync window {key} failed: {exc}")
+                failed.append(key)
+            else:
+                checkpoint.mark_done(key)
+    finally:
+        # On Ctrl+C drop queued windows; the checkpoint lets the next run resume
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if not failed:
+        checkpoint.clear()
+    return failed_types + failed
 
 
 def main() -> None:
@@ -66,10 +343,48 @@ def main() -> None:
     parser.add_argument("--from-date", default=os.getenv("SYNC_FROM_DATE", ""))
     parser.add_argument("--to-date", default=os.getenv("SYNC_TO_DATE", ""))
     parser.add_argument("--voucher-no", default=os.getenv("SYNC_VOUCHER_NO"))
+    parser.add_argument(
+        "--window",
+        default=os.getenv("SYNC_WINDOW"),
+        help="Split vouchers/daybook into 'month', 'week' or N-day windows",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("SYNC_WORKERS", "4")),
+        help="Number of windows fetched concurrently",
+    )
+    parser.add_argument("--checkpoint", default=SYNC_CHECKPOINT)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=os.getenv("SYNC_INCREMENTAL", "").lower() in ("1", "true", "yes"),
+        help="Only sync records changed since the last successful run (not with --window)",
+    )
+    parser.add_argument("--state", default=SYNC_STATE, help="Watermark state file")
     args = parser.parse_args()
 
     types = [t.strip() for t in args.types.split(",") if t.strip()]
-    sync_data(types, args.from_date, args.to_date, args.voucher_no)
+    if args.window and args.from_date and args.to_date:
+        if args.incremental:
+            # Windows cover a fixed date range; AlterID watermarks do not split by date
+            parser.error("--incremental cannot be combined with --window")
+        failed = sync_windowed(
+            types,
+            args.from_date,
+            args.to_date,
+            args.window,
+            args.workers,
+            args.checkpoint,
+            args.voucher_no,
+        )
+        if failed:
+            raise SystemExit(f"{len(failed)} window(s) or type(s) failed; rerun to resume")
+    else:
+        watermarks = Watermarks(args.state, CLIENT_ID) if args.incremental else None
+        failed = sync_data(types, args.from_date, args.to_date, args.voucher_no, watermarks)
+        if failed:
+            raise SystemExit(f"Sync failed for {', '.join(failed)}")
 
 
 if __name__ == "__main__":
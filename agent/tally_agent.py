@@ -1,12 +1,17 @@
+import asyncio
+import hashlib
+import json
 import os
-import time
 import threading
+from typing import Optional, Tuple
 import requests
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
 from .tally_agent_prompt import prompt_template
-from tally_tool.client import TallyClient
+from .utils.batcher import MicroBatcher
+from .utils.dates import resolve_relative_dates
+from .utils.drain import DrainScheduler
+from .utils.intent import parse_intent
+from .utils.llm_cache import LLMCache
 from .utils.queue import WriteQueue
 
 # Load environment variables
@@ -15,35 +20,166 @@ load_dotenv()
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 CLIENT_ID = os.getenv("CLIENT_ID", "demo")
 CLIENT_TOKEN = os.getenv("CLIENT_TOKEN")
+QUEUE_PATH = os.path.join(os.path.dirname(__file__), "voucher_queue.db")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(__file__), "llm_cache.db"))
+# Seconds a message may wait for the LLM, including time spent batching
+LLM_MAX_LATENCY = float(os.getenv("LLM_MAX_LATENCY", "30"))
+# Sent instead of an answer when the LLM does not reply in time
+BUSY_REPLY = "Sorry, that is taking too long. Please try again in a moment."
+# Commands the rule-based parser is at least this sure of skip the LLM
+INTENT_MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", "0.75"))
+# Cached answers are only reused for the same prompt text and model
+PROMPT_VERSION = hashlib.sha256(f"{LLM_MODEL}\0{prompt_template}".encode()).hexdigest()[:16]
 
-# Set OpenRouter variables
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-os.environ["OPENAI_API_BASE"] = os.getenv("OPENAI_API_BASE")  # Needed for OpenRouter
 
-# Tally client and persistent queue
-tally_client = TallyClient()
-queue = WriteQueue(os.path.join(os.path.dirname(__file__), "voucher_queue.db"))
+class AgentRuntime:
+    """Lazily built LLM chain, Tally client, write queue and queue worker.
 
-# Initialize LLM using environment model
-llm = ChatOpenAI(
-    base_url=os.getenv("OPENAI_API_BASE"),
-    api_key=os.getenv("OPENAI_API_KEY"),
-    model="gpt-3.5-turbo"
-)
+    Importing this module only creates an empty runtime. Each component is
+    constructed on first access, and the background worker runs only after
+    ``start_worker`` is called, so processes that merely call
+    ``process_message`` (such as backend workers) never drain the queue.
+    """
 
-# Build prompt
-prompt = PromptTemplate(
-    input_variables=["user_input"],
-    template=prompt_template
-)
+    def __init__(self, queue_path: str = QUEUE_PATH) -> None:
+        self.queue_path = queue_path
+        self._lock = threading.RLock()
+        self._chain = None
+        self._tally_client = None
+        self._queue = None
+        self._llm_cache = None
+        self._llm_batcher = None
+        self._drain_scheduler = None
+        self._worker_thread = None
 
-# LangChain chain
-chain = prompt | llm
+    @property
+    def chain(self):
+        with self._lock:
+            if self._chain is None:
+                # langchain is slow to import; defer it until the LLM is needed
+                from langchain_core.prompts import PromptTemplate
+                from langchain_openai import ChatOpenAI
 
+                llm = ChatOpenAI(
+                    base_url=os.getenv("OPENAI_API_BASE"),  # Needed for OpenRouter
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    model=LLM_MODEL,
+                    timeout=LLM_MAX_LATENCY,
+                )
+                prompt = PromptTemplate(
+                    input_variables=["user_input"],
+                    template=prompt_template
+                )
+                self._chain = prompt | llm
+            return self._chain
 
-def process_message(user_text: str) -> str:
-    """Run the LLM chain on the provided text and upload the result."""
-    result = chain.invoke({"user_input": user_text})
+    @property
+    def tally_client(self):
+        with self._lock:
+            if self._tally_client is None:
+                from tally_tool.client import TallyClient
+
+                self._tally_client = TallyClient()
+            return self._tally_client
+
+    @property
+    def queue(self) -> WriteQueue:
+        with self._lock:
+            if self._queue is None:
+                self._queue = WriteQueue(self.queue_path)
+            return self._queue
+
+    @property
+    def llm_cache(self) -> LLMCache:
+        with self._lock:
+            if self._llm_cache is None:
+                self._llm_cache = LLMCache(
+                    LLM_CACHE_PATH,
+                    version=PROMPT_VERSION,
+                    ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+                    max_entries=int(os.getenv("LLM_CACHE_SIZE", "10000")),
+                )
+            return self._llm_cache
+
+    @property
+    def llm_batcher(self) -> MicroBatcher:
+        with self._lock:
+            if self._llm_batcher is None:
+                # Batches run their calls concurrently; LLM_CONCURRENCY caps the total
+                size = int(os.getenv("LLM_BATCH_SIZE", "4"))
+                self._llm_batcher = MicroBatcher(
+                    lambda texts: self.invoke_batch(texts, size),
+                    max_batch=size,
+                    max_wait=float(os.getenv("LLM_BATCH_WAIT", "0.05")),
+                    max_inflight=max(1, int(os.getenv("LLM_CONCURRENCY", "8")) // size),
+                    timeout=LLM_MAX_LATENCY,
+                )
+            return self._llm_batcher
+
+    def invoke_batch(self, texts: list, concurrency: int) -> list:
+        """Run the chain on several commands through its batch path."""
+        results = self.chain.batch(
+            [{"user_input": text} for text in texts],
+            config={"max_concurrency": concurrency},
+            return_exceptions=True,
+        )
+        # Chat models return a message; keep only its text
+        return [getattr(result, "content", result) for result in results]
+
+    @property
+    def drain_scheduler(self) -> DrainScheduler:
+        with self._lock:
+            if self._drain_scheduler is None:
+                scheduler = DrainScheduler(
+                    self.queue,
+                    self.tally_client.post_xml,
+                    self.tally_client.is_reachable,
+                    max_rate=float(os.getenv("QUEUE_MAX_RATE", "5")),
+                    max_backoff=float(os.getenv("QUEUE_MAX_BACKOFF", "60")),
+                )
+                # Drain the backlog as soon as any call finds Tally back up
+                self.tally_client.add_health_listener(lambda ok: ok and scheduler.notify())
+                self._drain_scheduler = scheduler
+            return self._drain_scheduler
+
+    def start_worker(self) -> threading.Thread:
+        """Start the queue-draining thread if it is not already running."""
+        with self._lock:
+            if self._worker_thread is None or not self._worker_thread.is_alive():
+                self.drain_scheduler.reset()
+                self._worker_thread = threading.Thread(
+                    target=self.drain_scheduler.run, name="queue-worker", daemon=True
+                )
+                self._worker_thread.start()
+            return self._worker_thread
+
+    def stop_worker(self) -> None:
+        """Stop the queue worker and wait for its current send to finish."""
+        with self._lock:
+            thread, self._worker_thread = self._worker_thread, None
+            if self._drain_scheduler is not None:
+                self._drain_scheduler.stop()
+        if thread is not None:
+            thread.join()
+
+
+runtime = AgentRuntime()
+
+
+def _answer_locally(user_text: str) -> Tuple[str, Optional[str]]:
+    """Resolve relative dates, then try the rule-based parser and the cache.
+
+    Returns the rewritten text and its answer, or ``None`` if the LLM is needed.
+    """
+    text = resolve_relative_dates(user_text)
+    intent, confidence = parse_intent(text)
+    if intent is not None and confidence >= INTENT_MIN_CONFIDENCE:
+        return text, json.dumps(intent)
+    return text, runtime.llm_cache.get(text)
+
+
+def _upload(result: str) -> None:
     try:
         backend_post(
             "/upload_voucher",
@@ -55,6 +191,43 @@ def process_message(user_text: str) -> str:
         )
     except requests.RequestException:
         pass
+
+
+def process_message(user_text: str) -> str:
+    """Run the LLM chain on the provided text and upload the result.
+
+    Phrases like "this month" are replaced with explicit dates first.
+    Common commands are answered by :func:`parse_intent` without calling the
+    LLM; other answers are cached per normalized text (see ``LLM_CACHE_*``).
+    If the LLM does not answer within ``LLM_MAX_LATENCY`` seconds,
+    ``BUSY_REPLY`` is returned and nothing is uploaded.
+    """
+    text, result = _answer_locally(user_text)
+    if result is None:
+        try:
+            # Concurrent messages share batched LLM calls
+            result = runtime.llm_batcher.submit(text)
+        except TimeoutError:
+            return BUSY_REPLY
+        runtime.llm_cache.put(text, result)
+    _upload(result)
+    return result
+
+
+async def aprocess_message(user_text: str) -> str:
+    """:func:`process_message` for event loops.
+
+    The wait for the LLM happens on the loop, so slow answers do not hold a
+    thread; only the short cache and upload calls run in worker threads.
+    """
+    text, result = await asyncio.to_thread(_answer_locally, user_text)
+    if result is None:
+        try:
+            result = await runtime.llm_batcher.asubmit(text)
+        except TimeoutError:
+            return BUSY_REPLY
+        await asyncio.to_thread(runtime.llm_cache.put, text, result)
+    await asyncio.to_thread(_upload, result)
     return result
 
 
@@ -70,51 +243,54 @@ def backend_post(route: str, data: dict) -> requests.Response:
 
 
 def is_tally_reachable() -> bool:
-    """Check if the Tally HTTP endpoint is reachable."""
-    try:
-        requests.get(tally_client.url, timeout=3)
-        return True
-    except requests.RequestException:
-        return False
+    """Check if the Tally HTTP endpoint is reachable (cached by the client)."""
+    return runtime.tally_client.is_reachable()
 
 
 def post_xml_with_queue(xml_str: str) -> str | None:
-    """Post XML to Tally or queue it if Tally is unreachable."""
+    """Post XML to Tally or queue it if Tally is unreachable.
+
+    Returns Tally's response, or ``None`` if the XML was queued. After a read
+    timeout or an error status Tally may already have applied the import, so
+    it is dead-lettered for review instead of queued, and the error re-raised.
+    """
     if is_tally_reachable():
         try:
-            return tally_client.post_xml(xml_str)
-        except requests.RequestException:
+            response = runtime.tally_client.post_xml(xml_str)
+        except (requests.ConnectionError, requests.ConnectTimeout):
             pass
-    queue.enqueue(xml_str, "xml")
+        except requests.RequestException as exc:
+            runtime.queue.mark_dead(runtime.queue.enqueue(xml_str, "xml"), str(exc))
+            raise
+        else:
+            # Tally is up, so anything still queued can go now
+            runtime.drain_scheduler.notify()
+            return response
+    runtime.queue.enqueue(xml_str, "xml")
+    runtime.drain_scheduler.notify()
     return None
 
 
-def queue_worker() -> None:
-    """Background worker to resend queued XML to Tally."""
-    while True:
-        tasks = queue.get_pending()
-        if tasks and is_tally_reachable():
-            for task_id, payload, _ in tasks:
-                try:
-                    tally_client.post_xml(payload)
-                    queue.mark_complete(task_id)
-                except requests.RequestException:
-                    pass
-        time.sleep(900)  # 15 minutes
-
-
-worker_thread = threading.Thread(target=queue_worker, daemon=True)
-worker_thread.start()
-
 # Run loop
 def run_agent():
+    runtime.start_worker()
     while True:
         user_input = input("\n💬 Enter a Tally-related query (or type 'exit'):\n> ")
         if user_input.lower() == "exit":
             break
+        if user_input.lower() == "queue":
+            print("\n📦 Queue:", runtime.drain_scheduler.stats())
+            continue
+        if user_input.lower() == "cache":
+            print("\n🗃️ LLM cache:", runtime.llm_cache.stats())
+            continue
         if user_input.lower().startswith("xml "):
             xml_payload = user_input[4:]
-            response = post_xml_with_queue(xml_payload)
+            try:
+                response = post_xml_with_queue(xml_payload)
+            except requests.RequestException as exc:
+                print(f"\n⚠️ Tally may have applied this XML ({exc}); kept in the dead-letter queue for review.")
+                continue
             if response:
                 print("\n🧾 Tally Response:\n", response)
             else:
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, Optional
+
+
+class MicroBatcher:
+    """Group concurrent calls into batches for ``run_batch``.
+
+    :meth:`submit` blocks the calling thread until its result is ready;
+    :meth:`asubmit` is the same for coroutines.
+    Items arriving within ``max_wait`` seconds of the oldest waiting one
+    (or until ``max_batch`` have arrived) are passed to ``run_batch`` as one
+    list, identical items only once. ``run_batch`` returns one result per
+    item, or an exception instance for items that failed. At most
+    ``max_inflight`` batches run at a time, and a caller gives up with
+    ``TimeoutError`` once it has waited ``timeout`` seconds.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Hashable]], List[object]],
+        max_batch: int = 8,
+        max_wait: float = 0.05,
+        max_inflight: int = 4,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.batches = 0
+        self.items = 0
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="llm-batch")
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+
+    def _enqueue(self, item: Hashable) -> Future:
+        future: Future = Future()
+        with self._cond:
+            if self._stop:
+                raise RuntimeError("batcher is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+                self._thread.start()
+            self._pending.append((item, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def submit(self, item: Hashable):
+        """Return the result for ``item``, raising the exception it produced."""
+        future = self._enqueue(item)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            # Not sent yet: drop it from its batch
+            future.cancel()
+            raise
+
+    async def asubmit(self, item: Hashable):
+        """Like :meth:`submit`, but waits on the event loop instead of a thread."""
+        # Timing out cancels the wrapped future, which drops unsent items too
+        return await asyncio.wait_for(asyncio.wrap_future(self._enqueue(item)), self.timeout)
+
+    def _take(self) -> list:
+        with self._cond:
+            while not self._pending and not self._stop:
+                self._cond.wait()
+            if self._stop:
+                return []
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.max_batch and not self._stop:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = []
+            while self._pending and len(batch) < self.max_batch:
+                batch.append(self._pending.popleft())
+        # Skip callers that already timed out
+        return [(item, future) for item, future, _ in batch if future.set_running_or_notify_cancel()]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take()
+            if self._stop:
+                for _, future in batch:
+                    future.set_exception(RuntimeError("batcher is closed"))
+                return
+            if batch:
+                # Wait for a free slot so at most max_inflight batches hit the LLM
+                self._slots.acquire()
+                self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: list) -> None:
+        try:
+            unique = list(dict.fromkeys(item for item, _ in batch))
+            try:
+                results = dict(zip(unique, self.run_batch(unique)))
+            except Exception as exc:
+                results = {item: exc for item in unique}
+            with self._cond:
+                self.batches += 1
+                self.items += len(batch)
+            for item, future in batch:
+                result = results.get(item, RuntimeError("no result returned for item"))
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch": self.items / self.batches if self.batches else 0.0,
+                "waiting": len(self._pending),
+            }
+
+    def close(self) -> None:
+        """Fail waiting callers and stop; batches already sent still finish."""
+        with self._cond:
+            self._stop = True
+            pending, self._pending = list(self._pending), deque()
+            self._cond.notify_all()
+        for _, future, _ in pending:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError("batcher is closed"))
+        self._executor.shutdown(wait=True)
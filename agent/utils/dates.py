@@ -0,0 +1,97 @@
+"""Rewrite date-relative phrases in user commands as explicit dates.
+
+"Day book for this month" asked in October 2026 becomes "day book for
+2026-10-01 to 2026-10-31", so the LLM answer does not depend on when it was
+asked and can be cached safely.
+"""
+
+import re
+from datetime import date, timedelta
+from typing import Callable, Optional, Tuple
+
+Range = Tuple[date, date]
+
+
+def _month(d: date) -> Range:
+    start = d.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+
+def _week(d: date) -> Range:
+    start = d - timedelta(days=d.weekday())
+    return start, start + timedelta(days=6)
+
+
+def _financial_year(d: date) -> Range:
+    # Indian financial year, April to March
+    year = d.year if d.month >= 4 else d.year - 1
+    return date(year, 4, 1), date(year + 1, 3, 31)
+
+
+def _quarter(d: date) -> Range:
+    start = date(d.year, 3 * ((d.month - 1) // 3) + 1, 1)
+    end = (start + timedelta(days=95)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+
+# "today" and "yesterday" are ordinary words too ("Today Traders"), so they
+# are only rewritten as "today's" or after a date preposition, and not when
+# a capitalised word follows
+DAYS: list[Tuple[str, Callable[[date], Range]]] = [
+    (r"today(?:'s)?", lambda d: (d, d)),
+    (r"yesterday(?:'s)?", lambda d: (d - timedelta(days=1),) * 2),
+]
+DATE_PREPOSITIONS = ("for", "on", "of", "since", "from", "to", "till", "until", "upto", "as of")
+_DAY = (
+    "(?:" + "|".join(rf"(?<=\b{p} )" for p in DATE_PREPOSITIONS) + r")(?:today|yesterday)(?!\s+(?-i:[A-Z]))"
+    r"|(?:today|yesterday)'s"
+)
+
+PHRASES: list[Tuple[str, Callable[[date], Range]]] = [
+    (r"this week", _week),
+    (r"(?:last|previous) week", lambda d: _week(d - timedelta(days=7))),
+    (r"this month|current month", _month),
+    (r"(?:last|previous) month", lambda d: _month(d.replace(day=1) - timedelta(days=1))),
+    (r"this quarter|current quarter", _quarter),
+    (r"(?:last|previous) quarter", lambda d: _quarter(_quarter(d)[0] - timedelta(days=1))),
+    (r"(?:this|current) (?:financial|fiscal) year|this fy", _financial_year),
+    (
+        r"(?:last|previous) (?:financial|fiscal) year|last fy",
+        lambda d: _financial_year(_financial_year(d)[0] - timedelta(days=1)),
+    ),
+    (r"this year|current year", lambda d: (date(d.year, 1, 1), date(d.year, 12, 31))),
+    (r"(?:last|previous) year", lambda d: (date(d.year - 1, 1, 1), date(d.year - 1, 12, 31))),
+    (r"month to date|mtd", lambda d: (d.replace(day=1), d)),
+    (r"year to date|ytd", lambda d: (_financial_year(d)[0], d)),
+]
+
+_PATTERN = re.compile(
+    r"\b(?:(?P<phrase>" + "|".join([_DAY] + [f"(?:{p})" for p, _ in PHRASES]) + r")"
+    r"|(?:last|past) (?P<days>\d+) days)\b",
+    re.IGNORECASE,
+)
+_COMPILED = [(re.compile(f"(?:{p})$", re.IGNORECASE), fn) for p, fn in DAYS + PHRASES]
+
+
+def _format(start: date, end: date) -> str:
+    if start == end:
+        return start.isoformat()
+    return f"{start.isoformat()} to {end.isoformat()}"
+
+
+def resolve_relative_dates(text: str, today: Optional[date] = None) -> str:
+    """Replace phrases such as "last month" or "last 7 days" with ISO dates."""
+    today = today or date.today()
+
+    def replace(match: re.Match) -> str:
+        if match.group("days"):
+            days = int(match.group("days"))
+            return _format(today - timedelta(days=days - 1), today)
+        phrase = match.group("phrase")
+        for pattern, resolve in _COMPILED:
+            if pattern.match(phrase):
+                return _format(*resolve(today))
+        return phrase
+
+    return _PATTERN.sub(replace, text)
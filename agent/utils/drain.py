@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+import requests
+
+from .queue import WriteQueue
+
+logger = logging.getLogger(__name__)
+
+
+class DrainScheduler:
+    """Drain a :class:`WriteQueue` as soon as there is work and Tally is up.
+
+    The scheduler sleeps until ``notify`` is called (after an enqueue, or
+    when Tally is seen to come back) or the next retry becomes due. While
+    Tally is unreachable it probes with an exponential backoff between
+    ``min_backoff`` and ``max_backoff`` and drains the backlog as soon as
+    Tally answers. ``notify`` does not count as a probe, so it never
+    lengthens the backoff. Sends are paced to at most ``max_rate`` items per
+    second. Only items that failed to connect are retried; after a read
+    timeout or an error status the item is dead-lettered for review, since
+    Tally may already have applied it.
+    """
+
+    def __init__(
+        self,
+        queue: WriteQueue,
+        send: Callable[[str], object],
+        is_reachable: Callable[[], bool],
+        max_rate: float = 5.0,
+        batch_size: int = 50,
+        min_backoff: float = 5.0,
+        max_backoff: float = 60.0,
+        idle_timeout: float = 3600.0,
+    ) -> None:
+        self.queue = queue
+        self.send = send
+        self.is_reachable = is_reachable
+        self.max_rate = max_rate
+        self.batch_size = batch_size
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.idle_timeout = idle_timeout
+        self.tally_up = True
+        self._backoff = min_backoff
+        self._next_probe = 0.0
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._sent: deque[float] = deque()
+
+    def notify(self) -> None:
+        """Wake the scheduler, e.g. after enqueueing an item."""
+        self._wakeup.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+    def reset(self) -> None:
+        """Clear a previous :meth:`stop` so :meth:`run` can be started again."""
+        self._stop.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth, oldest waiting item age and recent drain throughput."""
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] > 60:
+            self._sent.popleft()
+        return {
+            "depth": self.queue.count("pending") + self.queue.count("leased"),
+            "dead": self.queue.count("dead"),
+            "oldest_age": self.queue.oldest_age(),
+            "throughput_per_min": len(self._sent),
+            "tally_up": self.tally_up,
+        }
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                delay = self._drain()
+            except Exception:
+                # Keep the thread alive; the queue is retried after a pause
+                logger.exception("Draining the write queue failed")
+                delay = self.min_backoff
+            self._wait(delay)
+
+    def _wait(self, timeout: float) -> None:
+        if timeout > 0:
+            self._wakeup.wait(timeout)
+
+    def _drain(self) -> float:
+        """Send everything that is due; return how long to sleep afterwards."""
+        due = self.queue.next_due()
+        if due is None:
+            return self.idle_timeout
+        if due > time.time():
+            return due - time.time()
+
+        if not self.is_reachable():
+            self.tally_up = False
+            now = time.monotonic()
+            if now >= self._next_probe:
+                self._next_probe = now + self._backoff
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+            return self._next_probe - now
+        self.tally_up = True
+        self._backoff = self.min_backoff
+        self._next_probe = 0.0
+
+        interval = 1.0 / self.max_rate if self.max_rate > 0 else 0.0
+        while not self._stop.is_set():
+            batch = self.queue.claim(self.batch_size)
+            if not batch:
+                return 0.0
+            for pos, (task_id, payload, _) in enumerate(batch):
+                started = time.monotonic()
+                try:
+                    self.send(payload)
+                except (requests.ConnectionError, requests.ConnectTimeout) as exc:
+                    # Tally went away mid-drain; retry this item and hand back the untried ones
+                    self.queue.mark_failed(task_id, str(exc))
+                    self.queue.release([row[0] for row in batch[pos + 1:]])
+                    self.tally_up = False
+                    return self._backoff
+                except requests.RequestException as exc:
+                    # A read timeout or error status means Tally got the import and
+                    # may have applied it; resending could duplicate vouchers
+                    self.queue.mark_dead(task_id, str(exc))
+                    continue
+                except Exception as exc:
+                    logger.exception("Sending queued item %s failed", task_id)
+                    self.queue.mark_failed(task_id, str(exc))
+                    continue
+                self.queue.mark_complete(task_id)
+                self._sent.append(time.monotonic())
+                remaining = interval - (time.monotonic() - started)
+                if remaining > 0:
+                    self._stop.wait(remaining)
+        return 0.0
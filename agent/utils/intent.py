@@ -0,0 +1,188 @@
+"""Rule-based intent parser for the commands the agent sees most often.
+
+"Show day book for 2026-10-01 to 2026-10-31" or "list stock items" map
+directly onto a ``root_task``/``sub_task`` pair from the prompt in
+:mod:`agent.tally_agent_prompt`. :func:`parse_intent` recognises them with
+keyword rules and returns the same JSON structure the LLM would, together
+with a confidence score. Anything it does not fully understand scores low
+and is left to the LLM.
+
+Relative dates are expected to be resolved already
+(see :func:`agent.utils.dates.resolve_relative_dates`).
+"""
+
+import re
+from datetime import date, timedelta
+from typing import Optional, Tuple
+
+# (root_task, sub_task, pattern, accepts a party filter)
+RULES: list[Tuple[str, str, str, bool]] = [
+    ("Master Data Access", "Ledgers", r"ledgers?(?: list| master)?|list of ledgers|(?:ledger )?accounts list", True),
+    ("Master Data Access", "Groups", r"(?:account |ledger )?groups", False),
+    ("Master Data Access", "Stock Items", r"stock items?|inventory items?|items list|list of items", False),
+    ("Master Data Access", "Stock Groups", r"stock groups?", False),
+    ("Reports", "Day Book", r"day ?book|daybook", False),
+    ("Reports", "Outstanding Receivables", r"(?:outstanding )?receivables?|bills receivable|sundry debtors|debtors|outstanding", True),
+    ("Reports", "Outstanding Payables", r"(?:outstanding )?payables?|bills payable|sundry creditors|creditors", True),
+    ("Reports", "Trial Balance", r"trial balance|tb", False),
+    ("Reports", "Balance Sheet", r"balance ?sheet", False),
+    ("Reports", "Profit & Loss", r"profit (?:and|&) loss(?: account| statement)?|p ?& ?l|pnl", False),
+    ("Reports", "Stock Summary", r"stock summary|stock report|closing stock", False),
+    ("Reports", "Cash Book", r"cash ?book", False),
+    ("Company Info", "Company Details", r"company (?:info|details|information)", False),
+]
+
+_RULES = [
+    (root, sub, re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE), party)
+    for root, sub, pattern, party in RULES
+]
+
+# Words that carry no meaning beyond the matched rule
+FILLER = set(
+    """
+    a all an and any as at between by can current dated details display during entire
+    fetch for from full get give i in is list me my of on open please pull report
+    show statement the till to until view want what whole with you your
+    """.split()
+)
+
+# Verbs that ask for something other than a read; always left to the LLM
+ACTIONS = re.compile(
+    r"\b(?:create|add|make|record|enter|post|delete|remove|alter|modify|update|edit|"
+    r"cancel|print|send|import|export|pay|receive|generate|file|reconcile)\b",
+    re.IGNORECASE,
+)
+
+_MONTHS = {
+    name: number
+    for number, names in enumerate(
+        [
+            ("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"),
+            ("may",), ("jun", "june"), ("jul", "july"), ("aug", "august"),
+            ("sep", "sept", "september"), ("oct", "october"), ("nov", "november"), ("dec", "december"),
+        ],
+        start=1,
+    )
+    for name in names
+}
+
+_ISO = r"\d{4}-\d{2}-\d{2}"
+_DMY = r"\d{1,2}[/.-]\d{1,2}[/.-]\d{4}"
+_DATE = rf"(?:{_ISO}|{_DMY})"
+_DATE_RANGE = re.compile(
+    rf"\b(?P<start>{_DATE})\s*(?:to|till|until|and|-)\s*(?P<end>{_DATE})\b|\b(?P<day>{_DATE})\b",
+    re.IGNORECASE,
+)
+_MONTH_YEAR = re.compile(
+    r"\b(?P<month>" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\.?,?\s+(?P<year>\d{4})\b",
+    re.IGNORECASE,
+)
+_FY = re.compile(r"\b(?:fy|financial year|fiscal year)\s*(?P<year>\d{4})\s*[-/]\s*(?P<end>\d{2}|\d{4})\b", re.IGNORECASE)
+_COMPANY = re.compile(r"\b(?:in|for|of)\s+company\s+(?P<name>[\w&.' -]+?)\s*(?=\bfor\b|\bfrom\b|\bbetween\b|$)", re.IGNORECASE)
+_PARTY = re.compile(r"\b(?:for|of|from|with|to)\s+(?:party\s+|customer\s+|supplier\s+)?(?P<name>[\w&.' -]+?)\s*$", re.IGNORECASE)
+# Prepositions left behind when a date is cut out of "... for Acme as of <date>"
+_TRAILING_PREPOSITIONS = re.compile(
+    r"(?:\s+(?:as (?:of|on)|for|from|between|during|in|on|of|since|till|until|upto|to|with))+$",
+    re.IGNORECASE,
+)
+# Negated requests ("day book not for March", "don't show ledgers") are left to the LLM
+NEGATIONS = re.compile(r"\b(?:not|no|don'?t|never|except|excluding|without)\b|n't\b", re.IGNORECASE)
+
+
+def _parse_date(text: str) -> Optional[date]:
+    try:
+        if re.fullmatch(_ISO, text):
+            return date.fromisoformat(text)
+        day, month, year = (int(part) for part in re.split(r"[/.-]", text))
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _cut(text: str, match: re.Match) -> str:
+    return f"{text[:match.start()]} {text[match.end():]}"
+
+
+def _cut_date(text: str, match: re.Match) -> str:
+    """Cut a date together with the prepositions that introduce it."""
+    return f"{_TRAILING_PREPOSITIONS.sub('', text[:match.start()].rstrip())} {text[match.end():]}"
+
+
+def _extract_dates(text: str) -> Tuple[Optional[dict], str]:
+    """Find one explicit date or date range; returns it and the remaining text."""
+    match = _FY.search(text)
+    if match:
+        year = int(match.group("year"))
+        return {"from": f"{year}-04-01", "to": f"{year + 1}-03-31"}, _cut_date(text, match)
+    match = _MONTH_YEAR.search(text)
+    if match:
+        month = _MONTHS[match.group("month").lower()]
+        start = date(int(match.group("year")), month, 1)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return {"from": start.isoformat(), "to": end.isoformat()}, _cut_date(text, match)
+    match = _DATE_RANGE.search(text)
+    if match:
+        if match.group("day"):
+            start = end = _parse_date(match.group("day"))
+        else:
+            start, end = _parse_date(match.group("start")), _parse_date(match.group("end"))
+        if start and end:
+            return {"from": start.isoformat(), "to": end.isoformat()}, _cut_date(text, match)
+    return None, text
+
+
+def parse_intent(text: str) -> Tuple[Optional[dict], float]:
+    """Return ``(intent, confidence)`` for ``text``.
+
+    ``intent`` has the ``root_task``/``sub_task``/``parameters`` structure
+    the LLM is prompted for, with only the fields that were mentioned. It is
+    ``None`` (confidence 0) when no rule or more than one rule matches, or
+    the text asks for a change rather than a read or is negated.
+    """
+    if ACTIONS.search(text) or NEGATIONS.search(text):
+        return None, 0.0
+    date_range, rest = _extract_dates(text)
+    if _DATE_RANGE.search(rest):
+        # A second date we cannot place
+        return None, 0.0
+
+    parameters: dict = {}
+    match = _COMPANY.search(rest)
+    if match:
+        parameters["company"] = match.group("name").strip()
+        rest = _cut(rest, match)
+
+    matches = []
+    for root, sub, pattern, party in _RULES:
+        match = pattern.search(rest)
+        if match:
+            matches.append((match.end() - match.start(), root, sub, party, match))
+    if not matches:
+        return None, 0.0
+    matches.sort(key=lambda m: m[0], reverse=True)
+    _, root, sub, party, match = matches[0]
+    # Other rules may only match inside the chosen keyword ("outstanding receivables")
+    for _, other_root, other_sub, _, other in matches[1:]:
+        if (other_root, other_sub) != (root, sub) and (other.start() < match.start() or other.end() > match.end()):
+            return None, 0.0
+    rest = _cut(rest, match)
+
+    filters = {}
+    if party:
+        found = _PARTY.search(rest.strip())
+        name = _TRAILING_PREPOSITIONS.sub("", found.group("name").strip()) if found else ""
+        if name and set(name.lower().split()) - FILLER:
+            filters["party"] = name
+            rest = _cut(rest.strip(), found)
+
+    if date_range:
+        parameters["date_range"] = date_range
+    if filters:
+        parameters["filters"] = filters
+
+    words = re.findall(r"[a-z0-9&']+", rest.lower())
+    unknown = [word for word in words if word not in FILLER]
+    # A single word the rules do not understand already puts the answer below
+    # the default threshold (0.75), so it goes to the LLM
+    confidence = max(0.0, 1.0 - 0.3 * len(unknown))
+    return {"root_task": root, "sub_task": sub, "parameters": parameters}, confidence
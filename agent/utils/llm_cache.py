@@ -0,0 +1,147 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def normalize(text: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", text).strip().rstrip(".!?").strip().casefold()
+
+
+class LLMCache:
+    """SQLite-backed cache of LLM responses.
+
+    Keys combine the normalized input with a ``version`` string naming the
+    prompt and model, so changing either starts from an empty cache.
+    Entries expire ``ttl`` seconds after they are stored, and once more
+    than ``max_entries`` are stored the least recently used are evicted.
+    Eviction runs every ``evict_every`` puts rather than on each one, so the
+    table may briefly hold up to that many extra entries.
+    Like :class:`~agent.utils.queue.WriteQueue`, each thread has its own
+    connection.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "llm_cache.db",
+        version: str = "",
+        ttl: float = 86400.0,
+        max_entries: int = 10000,
+        evict_every: int = 100,
+    ) -> None:
+        self.db_path = Path(db_path)
+        self.version = version
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict_every = max(1, evict_every)
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        with self.conn:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)"
+            )
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The calling thread's connection, opened on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.version}\0{normalize(text)}".encode()).hexdigest()
+
+    def get(self, text: str) -> Optional[str]:
+        """Return the cached response for ``text``, or ``None``."""
+        key = self.key(text)
+        now = time.time()
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT response FROM llm_cache WHERE key=? AND created_at>?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row:
+                self.conn.execute("UPDATE llm_cache SET last_used=? WHERE key=?", (now, key))
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, text: str, response: str) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO llm_cache (key, response, created_at, last_used) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    response=excluded.response, created_at=excluded.created_at, last_used=excluded.last_used
+                """,
+                (self.key(text), response, now, now),
+            )
+        with self._lock:
+            self._puts += 1
+            due = self._puts % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> None:
+        """Delete expired entries, then the least recently used beyond ``max_entries``."""
+        with self.conn:
+            self.conn.execute("DELETE FROM llm_cache WHERE created_at<=?", (time.time() - self.ttl,))
+            self.conn.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def stats(self) -> Dict[str, float]:
+        """Hits, misses and hit rate in this process, and the stored entry count."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0],
+        }
+
+    def clear(self) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM llm_cache")
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
@@ -1,29 +1,93 @@
 import sqlite3
+import threading
+import time
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 
 class WriteQueue:
-    """Simple SQLite-backed queue for voucher data."""
+    """SQLite-backed queue for voucher data.
 
-    def __init__(self, db_path: str = "queue.db") -> None:
+    Each thread gets its own connection to a WAL-mode database, so the CLI can
+    enqueue while a worker drains. Workers ``claim`` a batch of items under a
+    lease; items that are neither completed nor failed before the lease
+    expires become visible again. Failed items are retried with exponential
+    backoff and moved to the ``dead`` state after ``max_attempts``; items
+    that must not be resent are dead-lettered straight away with
+    ``mark_dead`` and stay there for review.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "queue.db",
+        max_attempts: int = 8,
+        backoff_base: float = 30.0,
+        backoff_max: float = 3600.0,
+        retention: float = 86400.0,
+        vacuum_every: int = 500,
+    ) -> None:
         self.db_path = Path(db_path)
-        self.conn = sqlite3.connect(self.db_path)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retention = retention
+        self.vacuum_every = vacuum_every
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._completed = 0
         self._create_table()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The calling thread's connection, opened on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
     def _create_table(self) -> None:
-        with self.conn:
-            self.conn.execute(
+        conn = self.conn
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Only takes effect after a full VACUUM, done once per database
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        with conn:
+            conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS queue (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     payload TEXT NOT NULL,
                     data_type TEXT NOT NULL,
                     status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL DEFAULT 0,
+                    lease_until REAL,
+                    last_error TEXT,
+                    completed_at REAL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
                 """
             )
+            # Queues created before leasing existed lack the newer columns
+            columns = {r[1] for r in conn.execute("PRAGMA table_info(queue)")}
+            for name, decl in (
+                ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+                ("available_at", "REAL NOT NULL DEFAULT 0"),
+                ("lease_until", "REAL"),
+                ("last_error", "TEXT"),
+                ("completed_at", "REAL"),
+            ):
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE queue ADD COLUMN {name} {decl}")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_queue_status_id ON queue (status, id)"
+            )
 
     def enqueue(self, payload: str, data_type: str = "xml") -> int:
         """Add a new item to the queue."""
@@ -34,18 +98,143 @@ class WriteQueue:
             )
             return cur.lastrowid
 
-    def get_pending(self) -> List[Tuple[int, str, str]]:
+    def claim(self, limit: int = 50, visibility_timeout: float = 300.0) -> List[Tuple[int, str, str]]:
+        """Lease up to ``limit`` due items for ``visibility_timeout`` seconds."""
+        now = time.time()
+        with self.conn:
+            rows = self.conn.execute(
+                """
+                UPDATE queue
+                SET status='leased', lease_until=?, attempts=attempts + 1
+                WHERE id IN (
+                    SELECT id FROM queue
+                    WHERE (status='pending' AND available_at <= ?)
+                       OR (status='leased' AND lease_until <= ?)
+                    ORDER BY id
+                    LIMIT ?
+                )
+                RETURNING id, payload, data_type
+                """,
+                (now + visibility_timeout, now, now, limit),
+            ).fetchall()
+        return sorted(rows)
+
+    def get_pending(self, limit: int = 100) -> List[Tuple[int, str, str]]:
+        """Return up to ``limit`` pending items without leasing them."""
         cur = self.conn.execute(
-            "SELECT id, payload, data_type FROM queue WHERE status='pending' ORDER BY id"
+            "SELECT id, payload, data_type FROM queue WHERE status='pending' ORDER BY id LIMIT ?",
+            (limit,),
+        )
+        return cur.fetchall()
+
+    def count(self, status: str = "pending") -> int:
+        cur = self.conn.execute("SELECT COUNT(*) FROM queue WHERE status=?", (status,))
+        return cur.fetchone()[0]
+
+    def next_due(self) -> Optional[float]:
+        """Epoch time at which the next item becomes claimable, if any."""
+        cur = self.conn.execute(
+            """
+            SELECT MIN(CASE status WHEN 'pending' THEN available_at ELSE lease_until END)
+            FROM queue WHERE status IN ('pending', 'leased')
+            """
+        )
+        return cur.fetchone()[0]
+
+    def oldest_age(self) -> float:
+        """Age in seconds of the oldest item still waiting to be sent."""
+        cur = self.conn.execute(
+            """
+            SELECT (julianday('now') - julianday(MIN(created_at))) * 86400
+            FROM queue WHERE status IN ('pending', 'leased')
+            """
+        )
+        return cur.fetchone()[0] or 0.0
+
+    def get_dead(self, limit: int = 100) -> List[Tuple[int, str, str, Optional[str]]]:
+        cur = self.conn.execute(
+            "SELECT id, payload, data_type, last_error FROM queue WHERE status='dead' ORDER BY id LIMIT ?",
+            (limit,),
         )
         return cur.fetchall()
 
     def mark_complete(self, task_id: int) -> None:
         with self.conn:
             self.conn.execute(
-                "UPDATE queue SET status='complete' WHERE id=?",
-                (task_id,),
+                "UPDATE queue SET status='complete', lease_until=NULL, completed_at=? WHERE id=?",
+                (time.time(), task_id),
+            )
+        with self._lock:
+            self._completed += 1
+            due = self._completed % self.vacuum_every == 0
+        if due:
+            self.purge_completed()
+
+    def mark_failed(self, task_id: int, error: Optional[str] = None) -> None:
+        """Schedule a retry with exponential backoff, or dead-letter the item."""
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT attempts FROM queue WHERE id=?", (task_id,)
+            ).fetchone()
+            if row is None:
+                return
+            attempts = row[0]
+            if attempts >= self.max_attempts:
+                self.conn.execute(
+                    "UPDATE queue SET status='dead', lease_until=NULL, last_error=? WHERE id=?",
+                    (error, task_id),
+                )
+                return
+            delay = min(self.backoff_base * 2 ** max(attempts - 1, 0), self.backoff_max)
+            self.conn.execute(
+                """
+                UPDATE queue
+                SET status='pending', lease_until=NULL, available_at=?, last_error=?
+                WHERE id=?
+                """,
+                (time.time() + delay, error, task_id),
+            )
+
+    def mark_dead(self, task_id: int, error: Optional[str] = None) -> None:
+        """Dead-letter an item at once, e.g. when Tally may already have applied it."""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE queue SET status='dead', lease_until=NULL, last_error=? WHERE id=?",
+                (error, task_id),
+            )
+
+    def release(self, task_ids: List[int]) -> None:
+        """Return leased items that were never attempted to the queue."""
+        with self.conn:
+            self.conn.executemany(
+                """
+                UPDATE queue SET status='pending', lease_until=NULL, attempts=attempts - 1
+                WHERE id=? AND status='leased'
+                """,
+                [(task_id,) for task_id in task_ids],
+            )
+
+    def requeue_dead(self) -> int:
+        """Give every dead-lettered item a fresh set of attempts."""
+        with self.conn:
+            cur = self.conn.execute(
+                "UPDATE queue SET status='pending', attempts=0, available_at=0 WHERE status='dead'"
+            )
+            return cur.rowcount
+
+    def purge_completed(self) -> int:
+        """Delete completed items older than ``retention`` and reclaim space."""
+        with self.conn:
+            cur = self.conn.execute(
+                "DELETE FROM queue WHERE status='complete' AND completed_at < ?",
+                (time.time() - self.retention,),
             )
+        self.conn.execute("PRAGMA incremental_vacuum")
+        return cur.rowcount
 
     def close(self) -> None:
-        self.conn.close()
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
@@ -1,6 +1,6 @@
-from agent.tally_agent import process_message
+from agent.tally_agent import aprocess_message
 
 
 async def process_text(text: str) -> str:
     """Process text using the Tally agent's LLM."""
-    return process_message(text)
+    return await aprocess_message(text)
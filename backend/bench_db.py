@@ -0,0 +1,116 @@
+"""Concurrent read/write benchmark for the backend database layer.
+
+Compares one shared connection guarded by a lock (the old module-level
+``conn``) with the WAL-mode :class:`ConnectionPool`. Reader threads poll
+``get_pending_tasks`` as fast as they can while writer threads insert tasks
+at a fixed rate.
+
+    python -m backend.bench_db --seconds 3 --readers 8 --writers 2
+"""
+
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import database
+
+
+def seed(db_path: Path, clients: int, tasks: int) -> None:
+    conn = database.init_db(db_path)
+    with conn:
+        for c in range(clients):
+            conn.execute(
+                "INSERT INTO clients (client_id, token) VALUES (?, ?)", (f"c{c}", f"t{c}")
+            )
+        payload_id = database._store_payload(conn, '{"amount": 1}')
+        conn.executemany(
+            "INSERT INTO tasks (client_id, payload_id, data_type) VALUES (?, ?, 'json')",
+            ((f"c{i % clients}", payload_id) for i in range(tasks)),
+        )
+    conn.close()
+
+
+def shared_connection(db_path: Path):
+    import sqlite3
+
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.create_function("inflate", 2, database.inflate, deterministic=True)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    lock = threading.Lock()
+
+    @contextmanager
+    def borrow():
+        with lock:
+            yield conn
+
+    return borrow
+
+
+def run(label, borrow, args) -> None:
+    stop = time.perf_counter() + args.seconds
+    read_latency: list[float] = []
+    writes = [0]
+
+    def reader(n):
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            with borrow() as conn:
+                database.get_pending_tasks(conn, f"c{n % args.clients}")
+            read_latency.append((time.perf_counter() - started) * 1000)
+
+    def writer(n):
+        interval = 1.0 / args.write_rate
+        count = 0
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            count += 1
+            # Distinct payloads, since identical unkeyed uploads are no-ops
+            payload = f'{{"amount": 1, "writer": {n}, "seq": {count}}}'
+            with borrow() as conn:
+                database.add_task(conn, f"c{n % args.clients}", payload, "json")
+            writes[0] += 1
+            time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    ordered = sorted(read_latency)
+    print(
+        f"{label:>6}: {len(ordered) / args.seconds:8.0f} reads/s "
+        f"{writes[0] / args.seconds:6.0f} writes/s  "
+        f"read p50 {statistics.median(ordered):.2f} ms  "
+        f"p99 {ordered[int(len(ordered) * 0.99)]:.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--write-rate", type=float, default=50.0, help="Writes/s per writer")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=20000)
+    args = parser.parse_args()
+
+    for label in ("shared", "pool"):
+        db_path = Path(tempfile.mkdtemp()) / "bench.db"
+        seed(db_path, args.clients, args.tasks)
+        if label == "shared":
+            borrow = shared_connection(db_path)
+        else:
+            borrow = database.ConnectionPool(args.readers + args.writers, db_path).connection
+        run(label, borrow, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Per-query latency before and after the access-path index migration.
+
+Seeds a database with ``--tasks`` tasks (one million by default), mostly
+already consumed, then times the hot queries at schema version 2 and again
+after migrating to the latest version.
+
+    python -m backend.bench_queries --tasks 1000000
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from . import database
+
+
+def seed(conn, clients: int, tasks: int) -> None:
+    with conn:
+        conn.executemany(
+            "INSERT INTO clients (client_id, token) VALUES (?, ?)",
+            ((f"c{c}", f"token-{c}") for c in range(clients)),
+        )
+        statuses = ["done"] * 90 + ["pending"] * 5 + ["rejected"] * 5
+        rng = random.Random(0)
+        conn.executemany(
+            """
+            INSERT INTO tasks (client_id, voucher_data, data_type, status, missing_fields)
+            VALUES (?, '{"amount": 1}', 'json', ?, ?)
+            """,
+            (
+                (f"c{rng.randrange(clients)}", s, "party" if s == "rejected" else None)
+                for s in (rng.choice(statuses) for _ in range(tasks))
+            ),
+        )
+
+
+def time_query(func, args_list) -> float:
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def pending_v2(conn, client_id: str):
+    """``get_pending_tasks`` as it read before payloads moved to their own table."""
+    return conn.execute(
+        """
+        SELECT id, client_id, voucher_data, data_type, created_at
+        FROM tasks WHERE status='pending' AND client_id=? ORDER BY id
+        """,
+        (client_id,),
+    ).fetchall()
+
+
+def report(conn, clients: int, label: str, get_pending=database.get_pending_tasks) -> None:
+    rng = random.Random(1)
+    picks = [rng.randrange(clients) for _ in range(50)]
+    pending = time_query(lambda c: get_pending(conn, f"c{c}"), [(c,) for c in picks])
+    token = time_query(
+        lambda c: database.get_client_by_token(conn, f"token-{c}"), [(c,) for c in picks]
+    )
+    rejected = time_query(lambda: database.get_rejected_tasks(conn), [()] * 5)
+    print(f"[{label}]")
+    print(f"  get_pending_tasks    {pending:9.3f} ms")
+    print(f"  get_client_by_token  {token:9.3f} ms")
+    print(f"  get_rejected_tasks   {rejected:9.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--clients", type=int, default=1000)
+    args = parser.parse_args()
+
+    conn = database.connect(Path(tempfile.mkdtemp()) / "bench.db")
+    database.migrate(conn, target=2)
+    seed(conn, args.clients, args.tasks)
+    report(conn, args.clients, "schema v2, no access-path indexes", pending_v2)
+    started = time.perf_counter()
+    database.migrate(conn)
+    print(f"migration took {time.perf_counter() - started:.1f} s")
+    report(conn, args.clients, f"schema v{len(database.MIGRATIONS)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Database size with inline payloads versus compressed, deduplicated ones.
+
+Simulates a client syncing a year of Day Book vouchers in weekly windows that
+overlap by a week, plus a daily ledger master export that rarely changes. The
+same uploads are stored at schema v4 (payload text on every task and voucher
+row), migrated in place to the latest schema, and loaded fresh through
+``add_records``. Each database is vacuumed before its size is taken.
+
+    python -m backend.bench_storage --vouchers 20000
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from . import database
+
+PARTIES = [f"Customer {n:03d}" for n in range(150)]
+ITEMS = [f"Item {n:04d}" for n in range(400)]
+
+
+def voucher_xml(number: int, day: date, rng: random.Random) -> str:
+    lines = []
+    total = 0
+    for _ in range(rng.randint(1, 6)):
+        qty, rate = rng.randint(1, 50), rng.randint(10, 5000)
+        total += qty * rate
+        lines.append(
+            "<ALLINVENTORYENTRIES.LIST>"
+            f"<STOCKITEMNAME>{rng.choice(ITEMS)}</STOCKITEMNAME>"
+            "<ISDEEMEDPOSITIVE>No</ISDEEMEDPOSITIVE>"
+            f"<RATE>{rate}.00/Nos</RATE>"
+            f"<AMOUNT>{qty * rate}.00</AMOUNT>"
+            f"<ACTUALQTY> {qty} Nos</ACTUALQTY>"
+            f"<BILLEDQTY> {qty} Nos</BILLEDQTY>"
+            "</ALLINVENTORYENTRIES.LIST>"
+        )
+    party = rng.choice(PARTIES)
+    return (
+        '<VOUCHER VCHTYPE="Sales" ACTION="Create" OBJVIEW="Invoice Voucher View">'
+        f"<DATE>{day:%Y%m%d}</DATE>"
+        "<VOUCHERTYPENAME>Sales</VOUCHERTYPENAME>"
+        f"<VOUCHERNUMBER>{number}</VOUCHERNUMBER>"
+        f"<PARTYLEDGERNAME>{party}</PARTYLEDGERNAME>"
+        "<PERSISTEDVIEW>Invoice Voucher View</PERSISTEDVIEW>"
+        f"<ALTERID>{number + 1000}</ALTERID>"
+        + "".join(lines)
+        + "<LEDGERENTRIES.LIST>"
+        f"<LEDGERNAME>{party}</LEDGERNAME>"
+        "<ISDEEMEDPOSITIVE>Yes</ISDEEMEDPOSITIVE>"
+        f"<AMOUNT>-{total}.00</AMOUNT>"
+        "</LEDGERENTRIES.LIST>"
+        "</VOUCHER>"
+    )
+
+
+def ledger_export(day: int) -> str:
+    # A new customer is added about once a fortnight
+    count = 100 + day // 14
+    body = "".join(
+        f'<LEDGER NAME="{name}"><PARENT>Sundry Debtors</PARENT>'
+        "<OPENINGBALANCE>0.00</OPENINGBALANCE></LEDGER>"
+        for name in PARTIES[:count]
+    )
+    return f"<ENVELOPE><BODY><DATA><COLLECTION>{body}</COLLECTION></DATA></BODY></ENVELOPE>"
+
+
+def uploads(vouchers: int, days: int, seed: int = 0):
+    """Yield batches of upload records in the order the agent sends them."""
+    rng = random.Random(seed)
+    start = date(2024, 4, 1)
+    per_day = max(1, vouchers // days)
+    by_day = [
+        [
+            voucher_xml(d * per_day + i + 1, start + timedelta(days=d), rng)
+            for i in range(per_day)
+        ]
+        for d in range(days)
+    ]
+    for d in range(days):
+        yield [{"voucher_data": ledger_export(d), "data_type": "xml"}]
+        if d % 7 == 6:
+            # Weekly window plus the previous week again for late edits
+            for day in range(max(0, d - 13), d + 1):
+                yield [
+                    {
+                        "voucher_data": xml,
+                        "data_type": "xml",
+                        "voucher_key": f"Sales|{day * per_day + i + 1}|{start + timedelta(days=day):%Y%m%d}",
+                    }
+                    for i, xml in enumerate(by_day[day])
+                ]
+
+
+def store_v4(conn, client_id: str, records: list[dict]) -> None:
+    """Store records the way ``add_records`` did before payload dedup."""
+    with conn:
+        for r in records:
+            params = (client_id, r["voucher_data"], r.get("voucher_key"))
+            conn.execute(
+                """
+                INSERT INTO tasks (client_id, voucher_data, voucher_key, data_type)
+                VALUES (?, ?, ?, 'xml')
+                ON CONFLICT (client_id, voucher_key) WHERE voucher_key IS NOT NULL
+                DO UPDATE SET voucher_data=excluded.voucher_data
+                WHERE voucher_data != excluded.voucher_data
+                """,
+                params,
+            )
+            conn.execute(
+                """
+                INSERT INTO vouchers (client_id, voucher_data, voucher_key)
+                VALUES (?, ?, ?)
+                ON CONFLICT (client_id, voucher_key) WHERE voucher_key IS NOT NULL
+                DO UPDATE SET voucher_data=excluded.voucher_data
+                WHERE voucher_data != excluded.voucher_data
+                """,
+                params,
+            )
+
+
+def size_of(conn) -> int:
+    conn.execute("VACUUM")
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vouchers", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=364)
+    args = parser.parse_args()
+    work = Path(tempfile.mkdtemp())
+
+    old = database.connect(work / "v4.db")
+    database.migrate(old, target=4)
+    database.upsert_client(old, "acme")
+    raw_bytes = 0
+    for batch in uploads(args.vouchers, args.days):
+        raw_bytes += sum(len(r["voucher_data"].encode()) for r in batch)
+        store_v4(old, "acme", batch)
+    v4 = size_of(old)
+    old.close()
+
+    shutil.copy(work / "v4.db", work / "migrated.db")
+    migrated = database.connect(work / "migrated.db")
+    started = time.perf_counter()
+    database.migrate(migrated)
+    migrate_seconds = time.perf_counter() - started
+    migrated_size = size_of(migrated)
+
+    fresh = database.init_db(work / "fresh.db")
+    database.upsert_client(fresh, "acme")
+    started = time.perf_counter()
+    for batch in uploads(args.vouchers, args.days):
+        database.add_records(fresh, "acme", batch)
+    load_seconds = time.perf_counter() - started
+    fresh_size = size_of(fresh)
+    codecs = dict(fresh.execute("SELECT codec, COUNT(*) FROM payloads GROUP BY codec").fetchall())
+
+    mib = 1024 * 1024
+    print(f"uploaded payload text     {raw_bytes / mib:8.1f} MiB")
+    print(f"schema v4 (inline text)   {v4 / mib:8.1f} MiB")
+    print(
+        f"migrated to v{len(database.MIGRATIONS)}            {migrated_size / mib:8.1f} MiB"
+        f"  ({migrated_size / v4:.0%}, migration {migrate_seconds:.1f} s)"
+    )
+    print(
+        f"loaded at v{len(database.MIGRATIONS)}              {fresh_size / mib:8.1f} MiB"
+        f"  ({fresh_size / v4:.0%}, load {load_seconds:.1f} s)"
+    )
+    print(f"payload codecs            {codecs}")
+
+
+if __name__ == "__main__":
+    main()
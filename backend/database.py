@@ -1,90 +1,388 @@
+import hashlib
+import json
+import os
+import queue
 import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Iterator, Optional, Dict, Any
 
 DB_PATH = Path(__file__).parent / "backend.db"
+BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
 
 import secrets
 
-# Ensure database tables exist
-def init_db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+try:
+    import zstandard
+except ImportError:  # payloads fall back to zlib
+    zstandard = None
+
+
+_zstd = threading.local()
+
+
+def _zstd_contexts():
+    # Contexts are costly to create and not thread safe, so keep one pair per thread
+    if not hasattr(_zstd, "contexts"):
+        _zstd.contexts = (zstandard.ZstdCompressor(level=9), zstandard.ZstdDecompressor())
+    return _zstd.contexts
+
+
+def compress_payload(data: bytes) -> tuple[str, bytes]:
+    """Compress a payload with zstd when available, else zlib.
+
+    Payloads that do not shrink are stored as they are.
+    """
+    if zstandard is not None:
+        codec, packed = "zstd", _zstd_contexts()[0].compress(data)
+    else:
+        codec, packed = "zlib", zlib.compress(data, 6)
+    if len(packed) >= len(data):
+        return "raw", data
+    return codec, packed
+
+
+def inflate(codec: str, data: bytes) -> str:
+    """Inverse of :func:`compress_payload`, returning the payload text."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd payloads")
+        return _zstd_contexts()[1].decompress(data).decode()
+    if codec == "zlib":
+        return zlib.decompress(data).decode()
+    return data.decode()
+
+
+def connect(db_path: Optional[Path] = None) -> sqlite3.Connection:
+    """Open a connection with the pragmas used throughout the backend."""
+    conn = sqlite3.connect(
+        db_path or DB_PATH, timeout=BUSY_TIMEOUT, check_same_thread=False
+    )
     conn.row_factory = sqlite3.Row
-    with conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS clients (
-                client_id TEXT PRIMARY KEY,
-                company_name TEXT,
-                last_sync TEXT,
-                last_tally_access TEXT,
-                token TEXT NOT NULL UNIQUE
-            )
-            """
+    # WAL lets readers proceed while a write is in progress; NORMAL sync is
+    # durable across application crashes and much cheaper than FULL.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-16000")  # 16 MiB
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.create_function("inflate", 2, inflate, deterministic=True)
+    return conn
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections.
+
+    A connection is used by one request at a time; ``connection()`` blocks
+    until one is free and rolls back anything left uncommitted on return.
+    """
+
+    def __init__(self, size: int = 8, db_path: Optional[Path] = None) -> None:
+        self.size = size
+        self._idle: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(size):
+            self._idle.put(connect(db_path))
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        for _ in range(self.size):
+            self._idle.get().close()
+
+
+def _create_base_tables(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS clients (
+            client_id TEXT PRIMARY KEY,
+            company_name TEXT,
+            last_sync TEXT,
+            last_tally_access TEXT,
+            token TEXT NOT NULL UNIQUE
         )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                client_id TEXT NOT NULL,
-                voucher_data TEXT NOT NULL,
-                data_type TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'pending',
-                missing_fields TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(client_id) REFERENCES clients(client_id)
-            )
-            """
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id TEXT NOT NULL,
+            voucher_data TEXT NOT NULL,
+            data_type TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            missing_fields TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(client_id) REFERENCES clients(client_id)
+        )
+        """
+    )
+    # Store uploaded voucher details for invoice generation
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS vouchers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id TEXT NOT NULL,
+            voucher_data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(client_id) REFERENCES clients(client_id)
         )
-        # Store uploaded voucher details for invoice generation
+        """
+    )
+
+
+def _add_voucher_keys(conn: sqlite3.Connection) -> None:
+    for table in ("tasks", "vouchers"):
+        # Databases from before migrations were tracked may already have it
+        columns = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+        if "voucher_key" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN voucher_key TEXT")
         conn.execute(
+            f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_voucher_key
+            ON {table} (client_id, voucher_key) WHERE voucher_key IS NOT NULL
             """
-            CREATE TABLE IF NOT EXISTS vouchers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                client_id TEXT NOT NULL,
-                voucher_data TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(client_id) REFERENCES clients(client_id)
+        )
+
+
+def _add_access_path_indexes(conn: sqlite3.Connection) -> None:
+    # get_pending_tasks: equality on client_id, rows already in created_at order
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_tasks_pending_client
+        ON tasks (client_id, created_at) WHERE status='pending'
+        """
+    )
+    # get_rejected_tasks: covering index over only the rejected rows
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_tasks_rejected
+        ON tasks (client_id, missing_fields) WHERE status='rejected'
+        """
+    )
+    # get_client_by_token is already served by the UNIQUE(token) index
+    conn.execute("ANALYZE")
+
+
+def _add_task_leases(conn: sqlite3.Connection) -> None:
+    conn.execute("ALTER TABLE tasks ADD COLUMN lease_until REAL")
+    conn.execute("ALTER TABLE tasks ADD COLUMN error TEXT")
+    # Keyset pagination walks pending tasks by id rather than created_at
+    conn.execute("DROP INDEX IF EXISTS idx_tasks_pending_client")
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_tasks_pending_client_id
+        ON tasks (client_id, id) WHERE status='pending'
+        """
+    )
+    # claim_tasks: pending tasks plus claimed ones whose lease may have expired
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_tasks_open_client_id
+        ON tasks (client_id, id) WHERE status IN ('pending', 'claimed')
+        """
+    )
+
+
+def _store_payloads_by_hash(conn: sqlite3.Connection) -> None:
+    # Payload text lives once per distinct content, compressed, and tasks
+    # and vouchers reference it instead of each holding their own copy.
+    conn.execute(
+        """
+        CREATE TABLE payloads (
+            id INTEGER PRIMARY KEY,
+            hash BLOB NOT NULL UNIQUE,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+        """
+    )
+    for table in ("tasks", "vouchers"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN payload_id INTEGER REFERENCES payloads(id)")
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                f"SELECT id, voucher_data FROM {table} WHERE id>? ORDER BY id LIMIT 1000",
+                (last_id,),
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany(
+                f"UPDATE {table} SET payload_id=? WHERE id=?",
+                [(_store_payload(conn, r["voucher_data"]), r["id"]) for r in rows],
             )
-            """
+            last_id = rows[-1]["id"]
+        conn.execute(f"ALTER TABLE {table} DROP COLUMN voucher_data")
+        # Finds earlier uploads of identical unkeyed payloads
+        conn.execute(f"CREATE INDEX idx_{table}_payload ON {table} (client_id, payload_id)")
+
+
+def _add_rejection_summary(conn: sqlite3.Connection) -> None:
+    # Dashboard aggregates, kept up to date by _insert_task
+    conn.execute("ALTER TABLE clients ADD COLUMN rejected_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute(
+        """
+        CREATE TABLE rejection_stats (
+            client_id TEXT NOT NULL,
+            field TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (client_id, field)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX idx_clients_rejected ON clients (client_id) WHERE rejected_count > 0
+        """
+    )
+    for row in conn.execute(
+        "SELECT client_id, missing_fields FROM tasks WHERE status='rejected'"
+    ).fetchall():
+        _count_rejection(conn, row["client_id"], row["missing_fields"], 1)
+
+
+def _add_outbox(conn: sqlite3.Connection) -> None:
+    # Outbound WhatsApp messages waiting for, or done with, their provider
+    conn.execute(
+        """
+        CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            provider TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL,
+            provider_id TEXT,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
         )
+        """
+    )
+    # Sending rows are leased; an expired lease makes them due again
+    conn.execute(
+        """
+        CREATE INDEX idx_outbox_due ON outbox (provider, available_at)
+        WHERE status IN ('pending', 'sending')
+        """
+    )
+
+
+def _add_outbox_client(conn: sqlite3.Connection) -> None:
+    # The client a message was sent for, so only it can read the status
+    conn.execute("ALTER TABLE outbox ADD COLUMN client_id TEXT")
+
+
+# Schema migrations, applied in order. The database's ``user_version``
+# records how many have run; append new steps, never edit existing ones.
+MIGRATIONS = [
+    _create_base_tables,
+    _add_voucher_keys,
+    _add_access_path_indexes,
+    _add_task_leases,
+    _store_payloads_by_hash,
+    _add_rejection_summary,
+    _add_outbox,
+    _add_outbox_client,
+]
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> int:
+    """Apply pending migrations up to ``target`` and return the new version."""
+    target = len(MIGRATIONS) if target is None else target
+    # IMMEDIATE takes the write lock up front so concurrent workers
+    # starting together apply each migration exactly once.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number in range(version, target):
+            MIGRATIONS[number](conn)
+            version = number + 1
+        conn.execute(f"PRAGMA user_version={version}")
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return version
+
+
+# Ensure database tables exist
+def init_db(db_path: Optional[Path] = None) -> sqlite3.Connection:
+    conn = connect(db_path)
+    migrate(conn)
     return conn
 
-# Simple helper to upsert a client
+
+def voucher_key(number: Optional[str], vchtype: Optional[str], date: Optional[str]) -> Optional[str]:
+    """Natural key of a voucher, or ``None`` if any part is missing."""
+    if not (number and vchtype and date):
+        return None
+    return f"{vchtype}|{number}|{date}"
+
 def upsert_client(
     conn: sqlite3.Connection, client_id: str, company_name: Optional[str] = None
 ) -> str:
+    """Create the client if needed and return its token.
+
+    An existing row is only written when ``company_name`` is given and
+    differs from the stored one.
+    """
+    token = secrets.token_hex(16)
     with conn:
-        cur = conn.execute(
-            "SELECT token FROM clients WHERE client_id=?", (client_id,)
-        )
-        row = cur.fetchone()
-        if row:
-            if company_name:
-                conn.execute(
-                    "UPDATE clients SET company_name=? WHERE client_id=?",
-                    (company_name, client_id),
-                )
-            return row["token"]
-        else:
-            token = secrets.token_hex(16)
-            conn.execute(
-                "INSERT INTO clients (client_id, company_name, token) VALUES (?, ?, ?)",
-                (client_id, company_name, token),
-            )
-            return token
+        row = conn.execute(
+            """
+            INSERT INTO clients (client_id, company_name, token) VALUES (?, ?, ?)
+            ON CONFLICT (client_id) DO UPDATE SET company_name=excluded.company_name
+            WHERE excluded.company_name IS NOT NULL
+              AND company_name IS NOT excluded.company_name
+            RETURNING token
+            """,
+            (client_id, company_name, token),
+        ).fetchone()
+    if row:
+        return row["token"]
+    # Conflict with nothing to change: the statement returned no row
+    return conn.execute(
+        "SELECT token FROM clients WHERE client_id=?", (client_id,)
+    ).fetchone()["token"]
+
+def rotate_token(conn: sqlite3.Connection, client_id: str) -> Optional[str]:
+    """Give the client a new token; the old one stops working immediately."""
+    with conn:
+        row = conn.execute(
+            "UPDATE clients SET token=? WHERE client_id=? RETURNING token",
+            (secrets.token_hex(16), client_id),
+        ).fetchone()
+    return row["token"] if row else None
 
 def update_sync(conn: sqlite3.Connection, client_id: str, last_sync: str, tally_access_ok: bool) -> None:
+    update_syncs(conn, [(client_id, last_sync, last_sync if tally_access_ok else None)])
+
+def update_syncs(conn: sqlite3.Connection, updates: list[tuple[str, str, Optional[str]]]) -> None:
+    """Apply ``(client_id, last_sync, last_tally_access)`` rows in one transaction.
+
+    A ``None`` tally access time leaves the stored one unchanged.
+    """
     with conn:
-        conn.execute(
-            "UPDATE clients SET last_sync=? WHERE client_id=?",
-            (last_sync, client_id),
+        conn.executemany(
+            """
+            UPDATE clients
+            SET last_sync=?, last_tally_access=COALESCE(?, last_tally_access)
+            WHERE client_id=?
+            """,
+            [(last_sync, tally_access, client_id) for client_id, last_sync, tally_access in updates],
         )
-        if tally_access_ok:
-            conn.execute(
-                "UPDATE clients SET last_tally_access=? WHERE client_id=?",
-                (last_sync, client_id),
-            )
 
 def get_client_by_token(conn: sqlite3.Connection, token: str) -> Optional[sqlite3.Row]:
     cur = conn.execute(
@@ -99,47 +397,379 @@ def get_clients(conn: sqlite3.Connection):
     )
     return cur.fetchall()
 
-def get_pending_tasks(conn: sqlite3.Connection, client_id: str):
+def get_dashboard_page(
+    conn: sqlite3.Connection,
+    search: Optional[str] = None,
+    rejected_only: bool = False,
+    offset: int = 0,
+    limit: int = 50,
+    top_fields: int = 3,
+) -> tuple[list[dict], int]:
+    """Return one page of clients with their rejection summary, and the total.
+
+    ``search`` matches client ids and company names. Each client carries
+    ``rejected_count`` and its ``top_missing`` ``(field, count)`` pairs.
+    """
+    where, params = [], []
+    if search:
+        where.append("(client_id LIKE ? ESCAPE '\\' OR company_name LIKE ? ESCAPE '\\')")
+        pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        params += [pattern, pattern]
+    if rejected_only:
+        where.append("rejected_count > 0")
+    clause = f"WHERE {' AND '.join(where)}" if where else ""
+    total = conn.execute(f"SELECT COUNT(*) FROM clients {clause}", params).fetchone()[0]
+    clients = [
+        dict(r)
+        for r in conn.execute(
+            f"""
+            SELECT client_id, company_name, last_sync, last_tally_access, rejected_count
+            FROM clients {clause}
+            ORDER BY client_id
+            LIMIT ? OFFSET ?
+            """,
+            params + [limit, offset],
+        )
+    ]
+    by_id = {c["client_id"]: c for c in clients}
+    for c in clients:
+        c["top_missing"] = []
+    rejected = [cid for cid, c in by_id.items() if c["rejected_count"]]
+    if rejected:
+        for r in conn.execute(
+            f"""
+            SELECT client_id, field, count FROM rejection_stats
+            WHERE client_id IN ({','.join('?' * len(rejected))})
+            ORDER BY client_id, count DESC, field
+            """,
+            rejected,
+        ):
+            top = by_id[r["client_id"]]["top_missing"]
+            if len(top) < top_fields:
+                top.append((r["field"], r["count"]))
+    return clients, total
+
+def get_pending_tasks(conn: sqlite3.Connection, client_id: str, after_id: int = 0, limit: Optional[int] = None):
+    """Return pending tasks with ``id > after_id`` in id order.
+
+    Pass the last id of one page as ``after_id`` to fetch the next.
+    """
     cur = conn.execute(
         """
-        SELECT id, client_id, voucher_data, data_type, created_at
-        FROM tasks
-        WHERE status='pending' AND client_id=?
-        ORDER BY created_at
+        SELECT t.id, t.client_id, inflate(p.codec, p.data) AS voucher_data, t.data_type, t.created_at
+        FROM tasks t JOIN payloads p ON p.id=t.payload_id
+        WHERE t.status='pending' AND t.client_id=? AND t.id>?
+        ORDER BY t.id
+        LIMIT ?
         """,
-        (client_id,),
+        (client_id, after_id, -1 if limit is None else limit),
     )
     return cur.fetchall()
 
-def add_task(conn: sqlite3.Connection, client_id: str, voucher_data: str, data_type: str, status: str = "pending", missing_fields: Optional[str] = None) -> int:
+def claim_tasks(conn: sqlite3.Connection, client_id: str, limit: int, lease_seconds: float) -> list:
+    """Lease up to ``limit`` tasks to the client.
+
+    Claimed tasks are hidden from other claims until acknowledged or until
+    the lease runs out, after which they can be claimed again.
+    """
+    now = time.time()
     with conn:
-        cur = conn.execute(
+        rows = conn.execute(
             """
-            INSERT INTO tasks (client_id, voucher_data, data_type, status, missing_fields)
-            VALUES (?, ?, ?, ?, ?)
+            UPDATE tasks SET status='claimed', lease_until=?
+            WHERE id IN (
+                SELECT id FROM tasks
+                WHERE client_id=? AND status IN ('pending', 'claimed')
+                  AND (status='pending' OR lease_until <= ?)
+                ORDER BY id
+                LIMIT ?
+            )
+            RETURNING id, client_id,
+                (SELECT inflate(codec, data) FROM payloads WHERE id=payload_id) AS voucher_data,
+                data_type, created_at
             """,
-            (client_id, voucher_data, data_type, status, missing_fields),
-        )
-        return cur.lastrowid
+            (now + lease_seconds, client_id, now, limit),
+        ).fetchall()
+    return sorted(rows, key=lambda r: r["id"])
 
-def add_voucher(conn: sqlite3.Connection, client_id: str, voucher_data: str) -> int:
-    """Insert a voucher record for invoice generation"""
+def ack_tasks(conn: sqlite3.Connection, client_id: str, task_ids: list[int], status: str, error: Optional[str] = None) -> int:
+    """Mark claimed tasks ``done`` or ``failed``; returns how many changed."""
+    if status not in ("done", "failed"):
+        raise ValueError(f"Invalid ack status: {status}")
     with conn:
-        cur = conn.execute(
-            "INSERT INTO vouchers (client_id, voucher_data) VALUES (?, ?)",
-            (client_id, voucher_data),
+        cur = conn.executemany(
+            """
+            UPDATE tasks SET status=?, lease_until=NULL, error=?
+            WHERE id=? AND client_id=? AND status='claimed'
+            """,
+            [(status, error, task_id, client_id) for task_id in task_ids],
+        )
+        return cur.rowcount
+
+def _store_payload(conn: sqlite3.Connection, voucher_data: str) -> int:
+    """Return the id of the stored payload, compressing and inserting it if new."""
+    raw = voucher_data.encode()
+    digest = hashlib.sha256(raw).digest()
+    row = conn.execute("SELECT id FROM payloads WHERE hash=?", (digest,)).fetchone()
+    if row:
+        return row[0]
+    codec, data = compress_payload(raw)
+    return conn.execute(
+        "INSERT INTO payloads (hash, codec, size, data) VALUES (?, ?, ?, ?)",
+        (digest, codec, len(raw), data),
+    ).lastrowid
+
+def _count_rejection(conn: sqlite3.Connection, client_id: str, missing_fields: Optional[str], delta: int) -> None:
+    """Add ``delta`` rejected tasks with ``missing_fields`` to the client's summary."""
+    conn.execute(
+        "UPDATE clients SET rejected_count=rejected_count+? WHERE client_id=?",
+        (delta, client_id),
+    )
+    fields = [f for f in (missing_fields or "").split(",") if f]
+    conn.executemany(
+        """
+        INSERT INTO rejection_stats (client_id, field, count) VALUES (?, ?, ?)
+        ON CONFLICT (client_id, field) DO UPDATE SET count=count+excluded.count
+        """,
+        [(client_id, field, delta) for field in fields],
+    )
+    if delta < 0:
+        conn.execute(
+            "DELETE FROM rejection_stats WHERE client_id=? AND count<=0", (client_id,)
+        )
+
+def _insert_task(conn: sqlite3.Connection, client_id: str, voucher_data: str, data_type: str, status: str = "pending", missing_fields: Optional[str] = None, voucher_key: Optional[str] = None) -> int:
+    """Insert or update a task; the caller must hold the write lock.
+
+    An unkeyed upload identical to a task that is still waiting to be
+    delivered returns that task; once delivered, it is queued again.
+    """
+    payload_id = _store_payload(conn, voucher_data)
+    if voucher_key is None:
+        existing = conn.execute(
+            """
+            SELECT id, payload_id, status, missing_fields FROM tasks
+            WHERE client_id=? AND payload_id=? AND status IN ('pending', 'claimed')
+            """,
+            (client_id, payload_id),
+        ).fetchone()
+    else:
+        existing = conn.execute(
+            "SELECT id, payload_id, status, missing_fields FROM tasks WHERE client_id=? AND voucher_key=?",
+            (client_id, voucher_key),
+        ).fetchone()
+    if existing and existing["payload_id"] == payload_id:
+        return existing["id"]
+
+    if existing:
+        task_id = existing["id"]
+        conn.execute(
+            """
+            UPDATE tasks
+            SET payload_id=?, data_type=?, status=?, missing_fields=?
+            WHERE id=?
+            """,
+            (payload_id, data_type, status, missing_fields, task_id),
         )
+        if existing["status"] == "rejected":
+            _count_rejection(conn, client_id, existing["missing_fields"], -1)
+    else:
+        task_id = conn.execute(
+            """
+            INSERT INTO tasks (client_id, payload_id, data_type, status, missing_fields, voucher_key)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (client_id, payload_id, data_type, status, missing_fields, voucher_key),
+        ).lastrowid
+    if status == "rejected":
+        _count_rejection(conn, client_id, missing_fields, 1)
+    return task_id
+
+def _insert_voucher(conn: sqlite3.Connection, client_id: str, voucher_data: str, voucher_key: Optional[str] = None) -> int:
+    payload_id = _store_payload(conn, voucher_data)
+    if voucher_key is None:
+        row = conn.execute(
+            "SELECT id FROM vouchers WHERE client_id=? AND payload_id=?",
+            (client_id, payload_id),
+        ).fetchone()
+        if row:
+            return row[0]
+    cur = conn.execute(
+        """
+        INSERT INTO vouchers (client_id, payload_id, voucher_key) VALUES (?, ?, ?)
+        ON CONFLICT (client_id, voucher_key) WHERE voucher_key IS NOT NULL
+        DO UPDATE SET payload_id=excluded.payload_id
+        WHERE payload_id != excluded.payload_id
+        """,
+        (client_id, payload_id, voucher_key),
+    )
+    if voucher_key is None:
         return cur.lastrowid
+    return conn.execute(
+        "SELECT id FROM vouchers WHERE client_id=? AND voucher_key=?",
+        (client_id, voucher_key),
+    ).fetchone()[0]
+
+def add_task(conn: sqlite3.Connection, client_id: str, voucher_data: str, data_type: str, status: str = "pending", missing_fields: Optional[str] = None, voucher_key: Optional[str] = None) -> int:
+    """Insert a task, or update the existing one with the same ``voucher_key``.
+
+    Re-uploading an unchanged voucher leaves the stored row untouched, as
+    does re-uploading an unkeyed payload the client already has a task for.
+    """
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        return _insert_task(conn, client_id, voucher_data, data_type, status, missing_fields, voucher_key)
+
+def add_voucher(conn: sqlite3.Connection, client_id: str, voucher_data: str, voucher_key: Optional[str] = None) -> int:
+    """Insert or update a voucher record for invoice generation"""
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        return _insert_voucher(conn, client_id, voucher_data, voucher_key)
+
+def add_records(conn: sqlite3.Connection, client_id: str, records: list[dict]) -> list[tuple[int, int]]:
+    """Store many uploads as tasks and vouchers in a single transaction.
+
+    Each record has ``voucher_data`` and ``data_type`` and optionally
+    ``status``, ``missing_fields`` and ``voucher_key``. Returns
+    ``(task_id, voucher_id)`` for each record, in order.
+    """
+    ids = []
+    with conn:
+        # Take the write lock first so a payload found by hash cannot be
+        # purged before the rows referencing it are written.
+        conn.execute("BEGIN IMMEDIATE")
+        for r in records:
+            key = r.get("voucher_key")
+            task_id = _insert_task(
+                conn,
+                client_id,
+                r["voucher_data"],
+                r["data_type"],
+                r.get("status", "pending"),
+                r.get("missing_fields"),
+                key,
+            )
+            ids.append((task_id, _insert_voucher(conn, client_id, r["voucher_data"], key)))
+    return ids
 
 def get_voucher(conn: sqlite3.Connection, voucher_id: int) -> Optional[sqlite3.Row]:
     cur = conn.execute(
-        "SELECT id, client_id, voucher_data, created_at FROM vouchers WHERE id=?",
+        """
+        SELECT v.id, v.client_id, inflate(p.codec, p.data) AS voucher_data, v.created_at
+        FROM vouchers v JOIN payloads p ON p.id=v.payload_id
+        WHERE v.id=?
+        """,
         (voucher_id,),
     )
     return cur.fetchone()
 
+def get_vouchers(conn: sqlite3.Connection, voucher_ids: list[int]) -> list[sqlite3.Row]:
+    """Fetch several vouchers by id; missing ids are left out."""
+    if not voucher_ids:
+        return []
+    return conn.execute(
+        f"""
+        SELECT v.id, v.client_id, inflate(p.codec, p.data) AS voucher_data, v.created_at
+        FROM vouchers v JOIN payloads p ON p.id=v.payload_id
+        WHERE v.id IN ({','.join('?' * len(voucher_ids))})
+        ORDER BY v.id
+        """,
+        voucher_ids,
+    ).fetchall()
+
 def get_rejected_tasks(conn: sqlite3.Connection):
     cur = conn.execute(
         "SELECT client_id, missing_fields FROM tasks WHERE status='rejected'"
     )
     return cur.fetchall()
+
+def purge_payloads(conn: sqlite3.Connection) -> int:
+    """Delete payloads no task or voucher refers to; returns how many.
+
+    Keyed records leave their old payload behind when their content changes.
+    Takes the write lock first, like the writers, so a payload cannot be
+    looked up by a writer and deleted before it is referenced.
+    """
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        return conn.execute(
+            """
+            DELETE FROM payloads
+            WHERE id NOT IN (SELECT payload_id FROM tasks WHERE payload_id IS NOT NULL)
+              AND id NOT IN (SELECT payload_id FROM vouchers WHERE payload_id IS NOT NULL)
+            """
+        ).rowcount
+
+def enqueue_message(conn: sqlite3.Connection, provider: str, payload: dict, client_id: Optional[str] = None) -> int:
+    """Queue an outbound message for ``provider``; returns its id."""
+    with conn:
+        return conn.execute(
+            "INSERT INTO outbox (provider, payload, available_at, client_id) VALUES (?, ?, ?, ?)",
+            (provider, json.dumps(payload), time.time(), client_id),
+        ).lastrowid
+
+def claim_messages(conn: sqlite3.Connection, provider: str, limit: int, lease_seconds: float) -> list:
+    """Lease up to ``limit`` due messages for sending, oldest first.
+
+    A message whose lease runs out before it is marked sent or failed (for
+    example because the server stopped) is claimed again.
+    """
+    now = time.time()
+    with conn:
+        rows = conn.execute(
+            """
+            UPDATE outbox SET status='sending', attempts=attempts+1, available_at=?
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE provider=? AND status IN ('pending', 'sending') AND available_at<=?
+                ORDER BY available_at
+                LIMIT ?
+            )
+            RETURNING id, payload, attempts
+            """,
+            (now + lease_seconds, provider, now, limit),
+        ).fetchall()
+    return sorted(rows, key=lambda r: r["id"])
+
+def next_message_due(conn: sqlite3.Connection, provider: str) -> Optional[float]:
+    """When the next pending or leased message for ``provider`` becomes due."""
+    return conn.execute(
+        """
+        SELECT MIN(available_at) FROM outbox
+        WHERE provider=? AND status IN ('pending', 'sending')
+        """,
+        (provider,),
+    ).fetchone()[0]
+
+def mark_message_sent(conn: sqlite3.Connection, message_id: int, provider_id: Optional[str]) -> None:
+    with conn:
+        conn.execute(
+            """
+            UPDATE outbox SET status='sent', provider_id=?, last_error=NULL, sent_at=CURRENT_TIMESTAMP
+            WHERE id=?
+            """,
+            (provider_id, message_id),
+        )
+
+def mark_message_failed(conn: sqlite3.Connection, message_id: int, error: str, retry_in: Optional[float]) -> None:
+    """Retry the message after ``retry_in`` seconds, or dead-letter it if ``None``."""
+    with conn:
+        if retry_in is None:
+            conn.execute(
+                "UPDATE outbox SET status='dead', last_error=? WHERE id=?",
+                (error, message_id),
+            )
+        else:
+            conn.execute(
+                "UPDATE outbox SET status='pending', available_at=?, last_error=? WHERE id=?",
+                (time.time() + retry_in, error, message_id),
+            )
+
+def get_message(conn: sqlite3.Connection, message_id: int) -> Optional[sqlite3.Row]:
+    return conn.execute(
+        """
+        SELECT id, client_id, provider, status, attempts, provider_id, last_error, created_at, sent_at
+        FROM outbox WHERE id=?
+        """,
+        (message_id,),
+    ).fetchone()
@@ -0,0 +1,47 @@
+"""Bounded executors for blocking work done by the FastAPI handlers.
+
+Handlers are ``async def``, so anything that blocks (sqlite3, wkhtmltopdf,
+the LLM, synchronous SDKs) must be awaited through one of these instead of
+being called on the event loop.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Sized to the connection pool so a DB thread never waits for a connection
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+# LLM calls and third-party SDKs
+BLOCKING_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BACKEND_BLOCKING_WORKERS", "8")),
+    thread_name_prefix="blocking",
+)
+# wkhtmltopdf subprocesses are CPU and memory heavy; keep them few
+RENDER_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("INVOICE_RENDER_WORKERS", "2")),
+    thread_name_prefix="render",
+)
+
+
+async def _run(executor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_db(func, *args, **kwargs):
+    return await _run(DB_EXECUTOR, func, *args, **kwargs)
+
+
+async def run_blocking(func, *args, **kwargs):
+    return await _run(BLOCKING_EXECUTOR, func, *args, **kwargs)
+
+
+async def run_render(func, *args, **kwargs):
+    return await _run(RENDER_EXECUTOR, func, *args, **kwargs)
+
+
+def shutdown() -> None:
+    for executor in (RENDER_EXECUTOR, BLOCKING_EXECUTOR, DB_EXECUTOR):
+        executor.shutdown(wait=True)
@@ -0,0 +1,78 @@
+"""Local stand-in for the Twilio and Gupshup messaging APIs.
+
+Point the backend at it to exercise the outbound queue without sending real
+messages:
+
+    uvicorn backend.fake_provider:app --port 9000
+    TWILIO_API_BASE=http://127.0.0.1:9000 GUPSHUP_API_BASE=http://127.0.0.1:9000 \\
+        uvicorn backend.main:app
+
+``FAKE_FAIL_RATE`` (0-1) makes that share of requests fail with a 503,
+``FAKE_MAX_RATE`` answers 429 with ``Retry-After`` above that many requests
+per second, and ``FAKE_LATENCY`` adds a delay in seconds. Accepted messages
+are listed by ``GET /sent``.
+"""
+
+import asyncio
+import os
+import random
+import time
+import uuid
+from collections import deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI()
+
+FAIL_RATE = float(os.getenv("FAKE_FAIL_RATE", "0"))
+MAX_RATE = float(os.getenv("FAKE_MAX_RATE", "0"))
+LATENCY = float(os.getenv("FAKE_LATENCY", "0"))
+
+sent: list[dict] = []
+_recent: deque[float] = deque()
+
+
+async def _gate():
+    """Return an error response to simulate provider trouble, or None."""
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    now = time.monotonic()
+    while _recent and now - _recent[0] > 1:
+        _recent.popleft()
+    if MAX_RATE and len(_recent) >= MAX_RATE:
+        return JSONResponse({"message": "Too many requests"}, status_code=429, headers={"Retry-After": "1"})
+    _recent.append(now)
+    if random.random() < FAIL_RATE:
+        return JSONResponse({"message": "Service unavailable"}, status_code=503)
+    return None
+
+
+@app.post("/2010-04-01/Accounts/{account_sid}/Messages.json")
+async def twilio_message(account_sid: str, request: Request):
+    error = await _gate()
+    if error:
+        return error
+    form = await request.form()
+    sid = f"SM{uuid.uuid4().hex}"
+    sent.append({"provider": "twilio", "id": sid, "at": time.time(), **form})
+    return JSONResponse(
+        {"sid": sid, "account_sid": account_sid, "status": "queued", "to": form.get("To"), "body": form.get("Body")},
+        status_code=201,
+    )
+
+
+@app.post("/api/v1/msg")
+async def gupshup_message(request: Request):
+    error = await _gate()
+    if error:
+        return error
+    form = await request.form()
+    message_id = str(uuid.uuid4())
+    sent.append({"provider": "gupshup", "id": message_id, "at": time.time(), **form})
+    return {"status": "submitted", "messageId": message_id}
+
+
+@app.get("/sent")
+async def list_sent():
+    return sent
@@ -0,0 +1,93 @@
+"""Buffered ``/sync_status`` heartbeats written to the database in batches."""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (client_id, last_sync, last_tally_access or None to keep the stored one)
+Heartbeat = Tuple[str, str, Optional[str]]
+
+
+class HeartbeatBuffer:
+    """Coalesce heartbeats per client and write them in one transaction.
+
+    Only the latest ``last_sync`` of each client is kept, along with the
+    latest time Tally was reachable. The buffer is flushed every
+    ``interval`` seconds, as soon as ``max_updates`` heartbeats have been
+    recorded, and on :meth:`close`.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Heartbeat]], Awaitable[None]],
+        interval: float = 5.0,
+        max_updates: int = 500,
+    ) -> None:
+        self._write = write
+        self.interval = interval
+        self.max_updates = max_updates
+        self._pending: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._updates = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def record(self, client_id: str, last_sync: str, tally_ok: bool) -> None:
+        """Buffer a heartbeat; must be called on the event loop."""
+        previous = self._pending.get(client_id)
+        tally_access = last_sync if tally_ok else (previous[1] if previous else None)
+        self._pending[client_id] = (last_sync, tally_access)
+        self._updates += 1
+        if self._updates >= self.max_updates and not (
+            self._flush_task and not self._flush_task.done()
+        ):
+            self._flush_task = asyncio.create_task(self._flush_logged())
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        """Write everything buffered so far; returns the number of clients."""
+        async with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending, self._updates = self._pending, {}, 0
+            try:
+                await self._write([(cid, sync, tally) for cid, (sync, tally) in batch.items()])
+            except BaseException:
+                # Keep the batch for the next attempt; anything newer wins
+                for cid, (sync, tally) in batch.items():
+                    newer = self._pending.get(cid)
+                    if newer is None:
+                        self._pending[cid] = (sync, tally)
+                    elif newer[1] is None:
+                        self._pending[cid] = (newer[0], tally)
+                raise
+            return len(batch)
+
+    async def _flush_logged(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Failed to write %d heartbeats", len(self._pending))
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._flush_logged()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        """Stop the periodic flush and write whatever is still buffered."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,173 @@
+"""Invoice PDFs rendered in the background and cached by content hash.
+
+A PDF is stored as ``<sha256 of the invoice HTML>.pdf``. The HTML is a function
+of the voucher and of ``invoice.html``, so editing either produces a new file
+rather than serving a stale one. wkhtmltopdf runs on the render executor, whose
+size bounds how many converter processes run at once.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import jinja2
+import pdfkit
+
+from .executors import run_render
+
+logger = logging.getLogger(__name__)
+
+
+class InvoiceRenderer:
+    """Render, cache and evict invoice PDFs under ``directory``.
+
+    The directory is kept under ``max_bytes`` and files unused for
+    ``max_age`` seconds are removed, least recently used first. Files used
+    within ``min_age`` seconds are never removed, so a path handed to a
+    request stays valid while it is sent.
+    """
+
+    def __init__(
+        self,
+        env: jinja2.Environment,
+        directory: Path,
+        template: str = "invoice.html",
+        max_bytes: int = 500 * 1024 * 1024,
+        max_age: float = 30 * 86400,
+        min_age: float = 300,
+        prerender_queue: int = 100,
+    ) -> None:
+        self.env = env
+        self.template = template
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.min_age = min_age
+        self.directory.mkdir(exist_ok=True)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._queue_size = prerender_queue
+        self._worker: Optional[asyncio.Task] = None
+        self._prune_lock = threading.Lock()
+        self._last_prune = 0.0
+
+    def html(self, voucher) -> str:
+        # get_template picks up edits to the template file
+        return self.env.get_template(self.template).render(voucher=dict(voucher))
+
+    async def render(self, voucher) -> Path:
+        """Return the PDF for ``voucher``, rendering it if not cached.
+
+        Cached files are returned without touching the render executor, so a
+        hit never queues behind a conversion. Concurrent calls for the same
+        content share one conversion.
+        """
+        html = self.html(voucher)
+        path = self.directory / f"{hashlib.sha256(html.encode()).hexdigest()}.pdf"
+        if self._touch(path):
+            return path
+        pending = self._inflight.get(path.name)
+        if pending is None:
+            pending = asyncio.ensure_future(run_render(self._fetch, html, path))
+            self._inflight[path.name] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(path.name, None))
+        return await asyncio.shield(pending)
+
+    @staticmethod
+    def _touch(path: Path) -> bool:
+        """Mark a cached file as recently used; ``False`` if it does not exist."""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _fetch(self, html: str, path: Path) -> Path:
+        # Another render may have finished since the caller looked
+        if self._touch(path):
+            return path
+        tmp = path.with_name(f"{path.stem}.{threading.get_ident()}.tmp")
+        try:
+            pdfkit.from_string(html, str(tmp))
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self.maybe_prune()
+        return path
+
+    def maybe_prune(self, interval: float = 60.0) -> None:
+        if time.monotonic() - self._last_prune >= interval:
+            self.prune()
+
+    def prune(self) -> int:
+        """Apply the age and size limits; returns how many files were removed."""
+        with self._prune_lock:
+            self._last_prune = time.monotonic()
+            now = time.time()
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith(".pdf"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for mtime, size, name in files:
+                if now - mtime < self.min_age:
+                    break
+                if total <= self.max_bytes and now - mtime <= self.max_age:
+                    break
+                try:
+                    os.remove(name)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            return removed
+
+    def free_slots(self) -> int:
+        if self._queue is None:
+            return 0
+        return self._queue.maxsize - self._queue.qsize()
+
+    def prerender(self, vouchers: Iterable) -> None:
+        """Queue vouchers for rendering ahead of the first request.
+
+        The queue is bounded; vouchers that do not fit are rendered on
+        demand instead.
+        """
+        if self._queue is None:
+            return
+        for voucher in vouchers:
+            try:
+                self._queue.put_nowait(voucher)
+            except asyncio.QueueFull:
+                break
+
+    async def _prerender_loop(self) -> None:
+        while True:
+            voucher = await self._queue.get()
+            try:
+                await self.render(voucher)
+            except Exception:
+                logger.exception("Pre-rendering invoice %s failed", voucher["id"])
+
+    def start(self) -> None:
+        """Start the pre-render worker; one, so on-demand renders keep the rest of the pool."""
+        self._queue = asyncio.Queue(self._queue_size)
+        self._worker = asyncio.create_task(self._prerender_loop())
+
+    async def close(self) -> None:
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._queue = None
@@ -0,0 +1,89 @@
+"""Measure /tasks latency while invoices are being rendered.
+
+wkhtmltopdf is replaced by a sleep of ``--render-seconds`` so the test runs
+without it; what matters is whether rendering blocks other requests.
+
+    python -m backend.loadtest --requests 200 --invoices 8
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args) -> None:
+    import httpx
+    import pdfkit
+
+    from . import database
+
+    database.DB_PATH = Path(tempfile.mkdtemp()) / "loadtest.db"
+
+    def fake_render(html, path, *a, **kw):
+        time.sleep(args.render_seconds)
+        Path(path).write_bytes(b"%PDF-1.4\n")
+
+    pdfkit.from_string = fake_render
+
+    # The renderer takes its directory when backend.main is imported
+    invoice_dir = Path(tempfile.mkdtemp())
+    os.environ["INVOICE_DIR"] = str(invoice_dir)
+    from . import main
+
+    assert main.invoice_renderer.directory == invoice_dir, "backend.main was imported too early"
+    with main.pool.connection() as conn:
+        token = database.upsert_client(conn, "loadtest")
+        voucher_ids = [
+            database.add_voucher(conn, "loadtest", f'{{"n": {i}}}') for i in range(args.invoices)
+        ]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        latencies = []
+
+        async def poll_tasks():
+            # Requests follow a fixed schedule and latency is measured from the
+            # scheduled time, so time spent with the event loop blocked counts.
+            first = time.perf_counter()
+            for i in range(args.requests):
+                scheduled = first + i * args.interval
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                resp = await client.get("/tasks", headers=headers)
+                resp.raise_for_status()
+                latencies.append((time.perf_counter() - scheduled) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            poll_tasks(),
+            *(client.get(f"/invoice/{vid}") for vid in voucher_ids),
+        )
+        elapsed = time.perf_counter() - started
+
+    print(f"/tasks requests: {len(latencies)} with {args.invoices} invoice renders in flight")
+    print(f"p50: {statistics.median(latencies):.1f} ms")
+    print(f"p99: {percentile(latencies, 99):.1f} ms")
+    print(f"max: {max(latencies):.1f} ms")
+    print(f"wall time: {elapsed:.2f} s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--invoices", type=int, default=8)
+    parser.add_argument("--render-seconds", type=float, default=0.5)
+    parser.add_argument("--interval", type=float, default=0.01)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,89 @@
-from fastapi import FastAPI, Request, HTTPException, Form
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi import Depends, FastAPI, Request, HTTPException, Form, Query
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 from datetime import datetime
 from pathlib import Path
+import asyncio
+import io
 import json
+import logging
 import os
-import pdfkit
-import requests
-from twilio.rest import Client as TwilioClient
-from agent.tally_agent import process_message
+import sqlite3
+import xml.etree.ElementTree as ET
+import zlib
+import httpx
+from agent.tally_agent import aprocess_message
+from tally_tool.xml_extractor import iter_elements, voucher_record
 
 from .database import (
+    ConnectionPool,
     init_db,
     upsert_client,
-    add_task,
-    add_voucher,
-    update_sync,
-    get_clients,
+    add_records,
+    ack_tasks,
+    claim_tasks,
+    update_syncs,
+    get_dashboard_page,
     get_pending_tasks,
-    get_rejected_tasks,
     get_client_by_token,
+    rotate_token,
     get_voucher,
+    get_vouchers,
+    get_message,
+    enqueue_message,
+    purge_payloads,
+    voucher_key,
 )
+from .cache import TTLCache
+from .heartbeats import HeartbeatBuffer
+from .invoices import InvoiceRenderer
+from .outbox import DeliveryError, GupshupProvider, OutboxWorker, TwilioProvider
+from .notify import TaskNotifier
+from .executors import DB_POOL_SIZE, run_blocking, run_db, shutdown as shutdown_executors
 
 app = FastAPI()
+logger = logging.getLogger(__name__)
 
 templates = Jinja2Templates(directory=str((__file__).rsplit('/',1)[0]+"/templates"))
-conn = init_db()
+init_db().close()
+pool = ConnectionPool(DB_POOL_SIZE)
+# A slot guarantees an idle connection, so checkout never blocks a thread
+_db_slots = asyncio.Semaphore(DB_POOL_SIZE)
+
+
+@asynccontextmanager
+async def db_session() -> AsyncIterator[sqlite3.Connection]:
+    """Borrow a pooled connection for the duration of the block."""
+    async with _db_slots:
+        with pool.connection() as conn:
+            yield conn
+
+
+async def get_db() -> AsyncIterator[sqlite3.Connection]:
+    """FastAPI dependency providing a pooled connection for one request."""
+    async with db_session() as conn:
+        yield conn
 
 # Directory for storing generated invoices
-INVOICE_DIR = Path(__file__).parent / "invoices"
-INVOICE_DIR.mkdir(exist_ok=True)
+INVOICE_DIR = Path(os.getenv("INVOICE_DIR", Path(__file__).parent / "invoices"))
+MAX_INVOICE_BATCH = 100
+# Renders one /invoices/render request may have waiting on the render pool
+INVOICE_RENDERS_PER_REQUEST = int(os.getenv("INVOICE_RENDERS_PER_REQUEST", "2"))
+invoice_renderer = InvoiceRenderer(
+    templates.env,
+    INVOICE_DIR,
+    max_bytes=int(float(os.getenv("INVOICE_DIR_MAX_MB", "500")) * 1024 * 1024),
+    max_age=float(os.getenv("INVOICE_MAX_AGE_DAYS", "30")) * 86400,
+    prerender_queue=int(os.getenv("INVOICE_PRERENDER_QUEUE", "100")),
+)
 
 # Twilio configuration from environment variables
 TWILIO_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER")
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE")
 
 # Gupshup configuration
 GUPSHUP_API_BASE = os.getenv("GUPSHUP_API_BASE", "https://api.gupshup.io")
@@ -44,19 +91,160 @@ GUPSHUP_API_KEY = os.getenv("GUPSHUP_API_KEY")
 GUPSHUP_SOURCE = os.getenv("GUPSHUP_SOURCE")
 GUPSHUP_SRC_NAME = os.getenv("GUPSHUP_SRC_NAME")
 
+# Outbound sends per second allowed to each provider
+TWILIO_RATE = float(os.getenv("TWILIO_RATE", "1"))
+GUPSHUP_RATE = float(os.getenv("GUPSHUP_RATE", "10"))
+
 REQUIRED_FIELDS = {"vchtype", "date", "party", "amount"}
+MAX_TASK_PAGE = 1000
+DEFAULT_LEASE_SECONDS = 300.0
+MAX_LONG_POLL = 60.0
+SSE_KEEPALIVE = 15.0
+BULK_BATCH_SIZE = 500
+MAX_BULK_LINE = 10 * 1024 * 1024
+BULK_READ_SIZE = 64 * 1024
+
+task_notifier = TaskNotifier()
+
+# Token -> client_id, and client_id -> last stored company name. Another
+# process rotating a token is only seen here once the entry expires.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+token_cache = TTLCache(AUTH_CACHE_TTL)
+company_cache = TTLCache(AUTH_CACHE_TTL)
+
+MAX_DASHBOARD_PAGE = 500
+dashboard_cache = TTLCache(float(os.getenv("DASHBOARD_CACHE_TTL", "10")), max_entries=1000)
+
+# Shared async client for outbound provider calls
+http_client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0))
+
+
+async def with_db(func, *args):
+    """Run ``func(conn, *args)`` on the database executor with a pooled connection."""
+    async with db_session() as conn:
+        return await run_db(func, conn, *args)
+
+
+async def invoice_media_urls(voucher_id: int) -> list[str]:
+    """Media for a queued invoice message, rendered when it is sent."""
+    async with db_session() as conn:
+        voucher = await run_db(get_voucher, conn, voucher_id)
+    if not voucher:
+        raise DeliveryError("Voucher not found", retryable=False)
+    return [f"file://{await invoice_renderer.render(voucher)}"]
+
+
+def outbound_providers() -> dict:
+    providers = {}
+    if TWILIO_SID and TWILIO_TOKEN and TWILIO_WHATSAPP_NUMBER:
+        providers["twilio"] = TwilioProvider(
+            TWILIO_SID, TWILIO_TOKEN, TWILIO_WHATSAPP_NUMBER, TWILIO_API_BASE, invoice_media_urls
+        )
+    if GUPSHUP_API_KEY and GUPSHUP_SOURCE:
+        providers["gupshup"] = GupshupProvider(
+            http_client, GUPSHUP_API_BASE, GUPSHUP_API_KEY, GUPSHUP_SOURCE, GUPSHUP_SRC_NAME
+        )
+    return providers
+
+
+# Queued WhatsApp messages, sent in the background at each provider's rate
+outbox = OutboxWorker(
+    with_db,
+    outbound_providers(),
+    {"twilio": TWILIO_RATE, "gupshup": GUPSHUP_RATE},
+)
+
+
+async def write_heartbeats(updates: list) -> None:
+    async with db_session() as conn:
+        await run_db(update_syncs, conn, updates)
+
+
+# /sync_status writes are coalesced per client and flushed in batches
+heartbeats = HeartbeatBuffer(
+    write_heartbeats,
+    interval=float(os.getenv("HEARTBEAT_FLUSH_SECONDS", "5")),
+    max_updates=int(os.getenv("HEARTBEAT_FLUSH_UPDATES", "500")),
+)
+
+
+PAYLOAD_PURGE_SECONDS = float(os.getenv("PAYLOAD_PURGE_SECONDS", "3600"))
+maintenance_task: Optional[asyncio.Task] = None
+
+
+async def purge_unused_payloads() -> None:
+    """Reclaim payloads left behind by updated records, at startup and then periodically."""
+    while True:
+        try:
+            removed = await with_db(purge_payloads)
+            if removed:
+                logger.info("Purged %d unused payloads", removed)
+        except Exception:
+            logger.exception("Purging unused payloads failed")
+        await asyncio.sleep(PAYLOAD_PURGE_SECONDS)
+
+
+@app.on_event("startup")
+async def start_background_tasks() -> None:
+    global maintenance_task
+    heartbeats.start()
+    invoice_renderer.start()
+    outbox.start()
+    maintenance_task = asyncio.create_task(purge_unused_payloads())
+    await run_blocking(invoice_renderer.prune)
 
 
-def authenticate(request: Request) -> str:
-    """Validate the Authorization header and return the client_id."""
+@app.on_event("shutdown")
+async def close_resources() -> None:
+    if maintenance_task:
+        maintenance_task.cancel()
+    await heartbeats.close()
+    await invoice_renderer.close()
+    await outbox.close()
+    await http_client.aclose()
+    shutdown_executors()
+    pool.close()
+
+
+def bearer_token(request: Request) -> str:
     auth = request.headers.get("Authorization")
     if not auth or not auth.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing token")
-    token = auth.split(" ", 1)[1]
-    client = get_client_by_token(conn, token)
-    if not client:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    return client["client_id"]
+    return auth.split(" ", 1)[1]
+
+
+async def authenticate(request: Request, conn: sqlite3.Connection) -> str:
+    """Validate the Authorization header and return the client_id.
+
+    Valid tokens are cached for ``AUTH_CACHE_TTL`` seconds; invalid ones
+    always go to the database.
+    """
+    token = bearer_token(request)
+    client_id = token_cache.get(token)
+    if client_id is None:
+        client = await run_db(get_client_by_token, conn, token)
+        if not client:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        client_id = client["client_id"]
+        token_cache.put(token, client_id)
+    return client_id
+
+
+def update_company(conn: sqlite3.Connection, client_id: str, company_name: Optional[str]) -> None:
+    """Store a new company name; repeats of the known one skip the write."""
+    if not company_name or company_cache.get(client_id) == company_name:
+        return
+    upsert_client(conn, client_id, company_name)
+    company_cache.put(client_id, company_name)
+
+
+@app.post("/rotate_token")
+async def rotate_client_token(request: Request, conn: sqlite3.Connection = Depends(get_db)):
+    """Replace the caller's token; the old one is rejected from now on."""
+    client_id = await authenticate(request, conn)
+    token = await run_db(rotate_token, conn, client_id)
+    token_cache.invalidate(bearer_token(request))
+    return {"client_id": client_id, "token": token}
 
 @app.post("/upload_voucher")
 async def upload_voucher(
@@ -65,106 +253,469 @@ async def upload_voucher(
     data_type: str = Form("json"),
     company_name: Optional[str] = Form(None),
     payload: str = Form(...),
+    conn: sqlite3.Connection = Depends(get_db),
 ):
     """Receive voucher data and store as a task."""
-    auth_client = authenticate(request)
+    auth_client = await authenticate(request, conn)
     if auth_client != client_id:
         raise HTTPException(status_code=403, detail="Token does not match client")
-    upsert_client(conn, client_id, company_name)
-    status = "pending"
-    missing_fields = None
+    result = await run_db(store_upload, conn, client_id, data_type, company_name, payload)
+    if result["status"] == "pending":
+        task_notifier.notify(client_id)
+    await prerender_invoices(conn, result.get("voucher_ids") or [result["voucher_id"]])
+    return result
+
+
+def validation(present) -> dict:
+    """Status and missing fields for a voucher with the ``present`` fields."""
+    missing = sorted(REQUIRED_FIELDS - set(present))
+    return {
+        "status": "rejected" if missing else "pending",
+        "missing_fields": ",".join(missing) if missing else None,
+    }
+
+
+def json_record(data, raw: str) -> dict:
+    """Validate a JSON voucher and describe how to store it.
+
+    Anything other than a JSON object is stored as rejected with every
+    required field missing.
+    """
+    if not isinstance(data, dict):
+        return {"voucher_data": raw, "data_type": "json", **validation(())}
+    return {
+        "voucher_data": raw,
+        "data_type": "json",
+        **validation(data),
+        "voucher_key": voucher_key(
+            data.get("voucher_no") or data.get("number"),
+            data.get("vchtype"),
+            data.get("date"),
+        ),
+    }
+
+
+def xml_record(elem: ET.Element) -> dict:
+    """Validate a single ``VOUCHER`` element and describe how to store it."""
+    rec = voucher_record(elem)
+    # Tally puts the amount on the ledger entries rather than the voucher
+    amount = rec["amount"] or elem.findtext(".//ALLLEDGERENTRIES.LIST/AMOUNT") or elem.findtext(
+        ".//LEDGERENTRIES.LIST/AMOUNT"
+    )
+    fields = {"vchtype": rec["type"], "date": rec["date"], "party": rec["party"], "amount": amount}
+    return {
+        "voucher_data": ET.tostring(elem, encoding="unicode"),
+        "data_type": "xml",
+        **validation(name for name, value in fields.items() if value),
+        "voucher_key": voucher_key(rec["number"], rec["type"], rec["date"]),
+    }
+
+
+def store_upload(conn: sqlite3.Connection, client_id: str, data_type: str, company_name: Optional[str], payload: str) -> dict:
+    """Validate and persist one upload; runs on the database thread."""
+    update_company(conn, client_id, company_name)
+    record = {"voucher_data": payload, "data_type": data_type}
 
     if data_type == "json":
         try:
-            import json
-            data = json.loads(payload)
-            missing = [f for f in REQUIRED_FIELDS if f not in data]
-            if missing:
-                status = "rejected"
-                missing_fields = ",".join(missing)
+            record = json_record(json.loads(payload), payload)
         except json.JSONDecodeError:
             raise HTTPException(status_code=400, detail="Invalid JSON")
-    task_id = add_task(conn, client_id, payload, data_type, status=status, missing_fields=missing_fields)
-    voucher_id = add_voucher(conn, client_id, payload)
-    return {"task_id": task_id, "voucher_id": voucher_id, "status": status}
+    elif data_type == "xml":
+        stored = store_xml_vouchers(conn, client_id, payload)
+        if stored:
+            task_ids, voucher_ids, statuses = zip(*stored)
+            return {
+                "task_ids": list(task_ids),
+                "voucher_ids": list(voucher_ids),
+                "statuses": list(statuses),
+                "status": "pending" if "pending" in statuses else "rejected",
+            }
+    [(task_id, voucher_id)] = add_records(conn, client_id, [record])
+    return {"task_id": task_id, "voucher_id": voucher_id, "status": record.get("status", "pending")}
+
+
+def store_xml_vouchers(conn: sqlite3.Connection, client_id: str, payload: str) -> list[tuple[int, int, str]]:
+    """Validate and upsert each ``VOUCHER`` in an XML export by its natural key.
+
+    Returns ``(task_id, voucher_id, status)`` per voucher, or an empty list
+    when the payload holds no vouchers (or is not parseable) and should be
+    stored whole.
+    """
+    records = []
+    try:
+        for elem in iter_elements(io.StringIO(payload), "VOUCHER"):
+            records.append(xml_record(elem))
+    except ET.ParseError:
+        if not records:
+            return []
+        raise HTTPException(status_code=400, detail="Invalid XML")
+    ids = add_records(conn, client_id, records)
+    return [(task_id, voucher_id, r["status"]) for (task_id, voucher_id), r in zip(ids, records)]
+
+
+def parse_bulk_record(line: bytes) -> dict:
+    """Turn one NDJSON line into a record for ``add_records``.
+
+    A line is either a JSON voucher, or ``{"data_type": "xml" | "json",
+    "payload": ...}`` wrapping a single XML ``VOUCHER`` or a JSON voucher.
+    Raises ``ValueError`` if the line cannot be stored.
+    """
+    obj = json.loads(line)
+    if not isinstance(obj, dict):
+        raise ValueError("Record must be a JSON object")
+    if "payload" not in obj:
+        return json_record(obj, line.decode())
+    payload = obj["payload"]
+    if obj.get("data_type", "json") == "xml":
+        elem = ET.fromstring(payload)
+        if elem.tag != "VOUCHER":
+            raise ValueError("XML payload must be a single VOUCHER element")
+        return xml_record(elem)
+    if isinstance(payload, str):
+        data = json.loads(payload)
+        if not isinstance(data, dict):
+            raise ValueError("payload must be a JSON object")
+        return json_record(data, payload)
+    if isinstance(payload, dict):
+        return json_record(payload, json.dumps(payload))
+    raise ValueError("payload must be a JSON object or string")
+
+
+async def ndjson_lines(request: Request) -> AsyncIterator[tuple[int, bytes]]:
+    """Yield ``(line_number, line)`` from an optionally gzipped body as it streams in.
+
+    Gzip is inflated ``BULK_READ_SIZE`` bytes at a time and any line longer
+    than ``MAX_BULK_LINE`` is refused as soon as it gets that long, so neither
+    a compressed bomb nor a missing newline is buffered whole.
+    """
+    gzipped = "gzip" in request.headers.get("Content-Encoding", "") or request.headers.get(
+        "Content-Type", ""
+    ).startswith(("application/gzip", "application/x-gzip"))
+    decompressor = zlib.decompressobj(wbits=47) if gzipped else None
+
+    def pieces(chunk: bytes):
+        if decompressor is None:
+            yield chunk
+            return
+        while True:
+            out = decompressor.decompress(chunk, BULK_READ_SIZE)
+            yield out
+            chunk = decompressor.unconsumed_tail
+            # A full read may leave output pending even with no input left
+            if not chunk and len(out) < BULK_READ_SIZE:
+                return
+
+    async def body():
+        async for chunk in request.stream():
+            for piece in pieces(chunk):
+                yield piece
+        if decompressor:
+            yield decompressor.flush()
+
+    buffer = bytearray()
+    number = 0
+    try:
+        async for piece in body():
+            start = 0
+            # Only the new bytes are searched for line breaks
+            while (end := piece.find(b"\n", start)) != -1:
+                buffer += piece[start:end]
+                start = end + 1
+                if len(buffer) > MAX_BULK_LINE:
+                    raise HTTPException(status_code=413, detail="Record too large")
+                number += 1
+                if buffer.strip():
+                    yield number, bytes(buffer)
+                buffer.clear()
+            buffer += piece[start:]
+            if len(buffer) > MAX_BULK_LINE:
+                raise HTTPException(status_code=413, detail="Record too large")
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Invalid gzip body")
+    if buffer.strip():
+        yield number + 1, bytes(buffer)
+
+
+@app.post("/upload_vouchers")
+async def upload_vouchers(request: Request, company_name: Optional[str] = Query(None)):
+    """Bulk upload: an NDJSON body (optionally gzip), one voucher per line.
+
+    Records are validated as they stream in and stored in batches of
+    ``BULK_BATCH_SIZE`` per transaction. The response lists the outcome of
+    every non-empty line.
+    """
+    async with db_session() as conn:
+        client_id = await authenticate(request, conn)
+        await run_db(update_company, conn, client_id, company_name)
+
+    results: list[dict] = []
+    batch: list[dict] = []
+    line_numbers: list[int] = []
+
+    async def flush() -> None:
+        async with db_session() as conn:
+            ids = await run_db(add_records, conn, client_id, batch)
+            await prerender_invoices(conn, [voucher_id for _, voucher_id in ids])
+        for number, record, (task_id, voucher_id) in zip(line_numbers, batch, ids):
+            result = {
+                "line": number,
+                "status": record.get("status", "pending"),
+                "task_id": task_id,
+                "voucher_id": voucher_id,
+            }
+            if record.get("missing_fields"):
+                result["missing_fields"] = record["missing_fields"]
+            results.append(result)
+        batch.clear()
+        line_numbers.clear()
+
+    async for number, line in ndjson_lines(request):
+        try:
+            record = parse_bulk_record(line)
+        except (ValueError, ET.ParseError) as exc:
+            results.append({"line": number, "status": "error", "error": str(exc)})
+            continue
+        batch.append(record)
+        line_numbers.append(number)
+        if len(batch) >= BULK_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    results.sort(key=lambda r: r["line"])
+    counts = {"pending": 0, "rejected": 0, "error": 0}
+    for r in results:
+        counts[r["status"]] += 1
+    if counts["pending"]:
+        task_notifier.notify(client_id)
+    return {"received": len(results), **counts, "results": results}
 
 
 @app.get("/tasks")
-async def get_tasks(request: Request):
-    client_id = authenticate(request)
-    tasks = get_pending_tasks(conn, client_id)
+async def get_tasks(
+    request: Request,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_TASK_PAGE),
+    wait: float = Query(0, ge=0, le=MAX_LONG_POLL),
+):
+    """Page through pending tasks; pass the last id seen as ``after_id``.
+
+    With ``wait`` > 0 an empty page is held open for up to ``wait`` seconds
+    and returned as soon as a new task arrives for the client.
+    """
+    # Connections are borrowed per query so a long poll does not pin one
+    async with db_session() as conn:
+        client_id = await authenticate(request, conn)
+    tasks = await _wait_for_tasks(client_id, after_id, limit, wait)
     return [dict(t) for t in tasks]
 
 
+async def _wait_for_tasks(client_id: str, after_id: int, limit: int, wait: float) -> list:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        event = task_notifier.event(client_id)
+        async with db_session() as conn:
+            tasks = await run_db(get_pending_tasks, conn, client_id, after_id, limit)
+        remaining = deadline - loop.time()
+        if tasks or remaining <= 0:
+            return tasks
+        if not await task_notifier.wait(event, remaining):
+            return []
+
+
+@app.get("/tasks/stream")
+async def stream_tasks(request: Request, after_id: int = Query(0, ge=0)):
+    """Server-sent events: one ``task`` event per pending task as it arrives.
+
+    Each event id is the task id, so a reconnecting client resumes from the
+    ``Last-Event-ID`` header.
+    """
+    async with db_session() as conn:
+        client_id = await authenticate(request, conn)
+    last_event = request.headers.get("Last-Event-ID", "")
+    cursor = int(last_event) if last_event.isdigit() else after_id
+
+    async def events():
+        nonlocal cursor
+        while not await request.is_disconnected():
+            tasks = await _wait_for_tasks(client_id, cursor, MAX_TASK_PAGE, SSE_KEEPALIVE)
+            if not tasks:
+                yield ": keepalive\n\n"
+                continue
+            for task in tasks:
+                cursor = task["id"]
+                yield f"id: {cursor}\nevent: task\ndata: {json.dumps(dict(task))}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/tasks/claim")
+async def claim(request: Request, data: dict, conn: sqlite3.Connection = Depends(get_db)):
+    """Lease up to ``limit`` tasks for ``lease_seconds``; ack them when done."""
+    client_id = await authenticate(request, conn)
+    try:
+        limit = min(int(data.get("limit", 100)), MAX_TASK_PAGE)
+        lease_seconds = float(data.get("lease_seconds", DEFAULT_LEASE_SECONDS))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid limit or lease_seconds")
+    if limit < 1 or lease_seconds <= 0:
+        raise HTTPException(status_code=400, detail="Invalid limit or lease_seconds")
+    tasks = await run_db(claim_tasks, conn, client_id, limit, lease_seconds)
+    return [dict(t) for t in tasks]
+
+
+@app.post("/tasks/ack")
+async def ack(request: Request, data: dict, conn: sqlite3.Connection = Depends(get_db)):
+    """Move claimed tasks to ``done`` or ``failed``."""
+    client_id = await authenticate(request, conn)
+    task_ids = data.get("task_ids")
+    status = data.get("status", "done")
+    if not isinstance(task_ids, list) or not all(isinstance(t, int) for t in task_ids):
+        raise HTTPException(status_code=400, detail="task_ids must be a list of ids")
+    if status not in ("done", "failed"):
+        raise HTTPException(status_code=400, detail="status must be 'done' or 'failed'")
+    updated = await run_db(ack_tasks, conn, client_id, task_ids, status, data.get("error"))
+    return {"updated": updated}
+
+
 @app.post("/sync_status")
-async def sync_status(request: Request, data: dict):
-    auth_client = authenticate(request)
+async def sync_status(request: Request, data: dict, conn: sqlite3.Connection = Depends(get_db)):
+    auth_client = await authenticate(request, conn)
     client_id = data.get("client_id") or auth_client
     if client_id != auth_client:
         raise HTTPException(status_code=403, detail="Token does not match client")
     last_sync = data.get("last_sync") or datetime.utcnow().isoformat()
     tally_ok = bool(data.get("tally_access_ok"))
-    upsert_client(conn, client_id)
-    update_sync(conn, client_id, last_sync, tally_ok)
+    heartbeats.record(client_id, last_sync, tally_ok)
     return {"status": "ok"}
 
 
+
+
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request):
-    clients = get_clients(conn)
-    rejected = get_rejected_tasks(conn)
-    reject_map = {}
-    for r in rejected:
-        cid = r["client_id"]
-        reject_map.setdefault(cid, []).append(r["missing_fields"])
-    return templates.TemplateResponse(
+async def dashboard(
+    request: Request,
+    q: Optional[str] = Query(None, max_length=100),
+    rejected: bool = False,
+    page: int = Query(1, ge=1),
+    per_page: int = Query(50, ge=1, le=MAX_DASHBOARD_PAGE),
+):
+    """One page of clients with their rejection summary.
+
+    Rendered pages are cached for ``DASHBOARD_CACHE_TTL`` seconds.
+    """
+    key = (q or "", rejected, page, per_page)
+    body = dashboard_cache.get(key)
+    if body is not None:
+        return HTMLResponse(body)
+    async with db_session() as conn:
+        clients, total = await run_db(
+            get_dashboard_page, conn, q, rejected, (page - 1) * per_page, per_page
+        )
+    response = templates.TemplateResponse(
+        request,
         "dashboard.html",
         {
-            "request": request,
             "clients": clients,
-            "rejected": reject_map,
+            "total": total,
+            "q": q or "",
+            "rejected_only": rejected,
+            "page": page,
+            "per_page": per_page,
+            "pages": max(1, -(-total // per_page)),
         },
     )
+    dashboard_cache.put(key, response.body)
+    return response
 
 
-def generate_invoice(voucher_row) -> Path:
-    """Render invoice HTML and convert to PDF."""
-    pdf_path = INVOICE_DIR / f"{voucher_row['id']}.pdf"
-    if pdf_path.exists():
-        return pdf_path
-    html_content = templates.get_template("invoice.html").render(
-        voucher=dict(voucher_row)
-    )
-    pdfkit.from_string(html_content, str(pdf_path))
-    return pdf_path
+async def prerender_invoices(conn: sqlite3.Connection, voucher_ids: list[int]) -> None:
+    """Queue freshly stored vouchers for background invoice rendering."""
+    voucher_ids = voucher_ids[: invoice_renderer.free_slots()]
+    if voucher_ids:
+        invoice_renderer.prerender(await run_db(get_vouchers, conn, voucher_ids))
 
 
 @app.get("/invoice/{voucher_id}")
 async def get_invoice(voucher_id: int):
-    voucher = get_voucher(conn, voucher_id)
+    # Release the connection before rendering, which can take seconds
+    async with db_session() as conn:
+        voucher = await run_db(get_voucher, conn, voucher_id)
     if not voucher:
         raise HTTPException(status_code=404, detail="Voucher not found")
-    pdf_path = generate_invoice(voucher)
+    pdf_path = await invoice_renderer.render(voucher)
     return FileResponse(path=pdf_path, filename=f"invoice_{voucher_id}.pdf", media_type="application/pdf")
 
 
+@app.post("/invoices/render")
+async def render_invoices(request: Request, data: dict):
+    """Render the calling client's invoices for ``voucher_ids`` ahead of time.
+
+    Returns which were rendered, which vouchers do not exist (or belong to
+    another client) and which failed; the PDFs are then served from cache by
+    ``/invoice/{id}``. At most ``INVOICE_RENDERS_PER_REQUEST`` conversions
+    are in flight per request.
+    """
+    voucher_ids = data.get("voucher_ids") or []
+    if not isinstance(voucher_ids, list) or not all(isinstance(i, int) for i in voucher_ids):
+        raise HTTPException(status_code=400, detail="voucher_ids must be a list of integers")
+    if len(voucher_ids) > MAX_INVOICE_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_INVOICE_BATCH} vouchers per batch")
+    async with db_session() as conn:
+        client_id = await authenticate(request, conn)
+        vouchers = await run_db(get_vouchers, conn, voucher_ids)
+    vouchers = [v for v in vouchers if v["client_id"] == client_id]
+    slots = asyncio.Semaphore(INVOICE_RENDERS_PER_REQUEST)
+
+    async def render(voucher):
+        async with slots:
+            return await invoice_renderer.render(voucher)
+
+    results = await asyncio.gather(*(render(v) for v in vouchers), return_exceptions=True)
+    found = {v["id"] for v in vouchers}
+    failed = {
+        v["id"]: str(result)
+        for v, result in zip(vouchers, results)
+        if isinstance(result, BaseException)
+    }
+    return {
+        "rendered": [v["id"] for v in vouchers if v["id"] not in failed],
+        "missing": [i for i in voucher_ids if i not in found],
+        "failed": failed,
+    }
+
+
 @app.post("/send_invoice/{voucher_id}")
 async def send_invoice(voucher_id: int, phone: str = Form(...)):
-    """Send the invoice PDF to the provided WhatsApp number via Twilio."""
-    voucher = get_voucher(conn, voucher_id)
-    if not voucher:
-        raise HTTPException(status_code=404, detail="Voucher not found")
-    pdf_path = generate_invoice(voucher)
-    if not (TWILIO_SID and TWILIO_TOKEN and TWILIO_WHATSAPP_NUMBER):
+    """Queue the invoice PDF for sending to a WhatsApp number via Twilio."""
+    if "twilio" not in outbox.providers:
         raise HTTPException(status_code=500, detail="Twilio not configured")
-    client = TwilioClient(TWILIO_SID, TWILIO_TOKEN)
-    message = client.messages.create(
-        from_=f"whatsapp:{TWILIO_WHATSAPP_NUMBER}",
-        to=f"whatsapp:{phone}",
-        body="Here is your invoice",
-        media_url=[f"file://{pdf_path}"]
-    )
-    return {"sid": message.sid}
+    async with db_session() as conn:
+        voucher = await run_db(get_voucher, conn, voucher_id)
+        if not voucher:
+            raise HTTPException(status_code=404, detail="Voucher not found")
+        message_id = await run_db(
+            enqueue_message,
+            conn,
+            "twilio",
+            {"to": phone, "body": "Here is your invoice", "voucher_id": voucher_id},
+            voucher["client_id"],
+        )
+    outbox.notify("twilio")
+    return {"message_id": message_id, "status": "queued"}
+
+
+@app.get("/messages/{message_id}")
+async def message_status(request: Request, message_id: int, conn: sqlite3.Connection = Depends(get_db)):
+    """Delivery status of one of the client's queued outbound messages."""
+    client_id = await authenticate(request, conn)
+    message = await run_db(get_message, conn, message_id)
+    # Other clients' messages are reported as missing rather than forbidden
+    if not message or message["client_id"] != client_id:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return dict(message)
 
 
 @app.post("/gupshup")
@@ -182,24 +733,15 @@ async def gupshup_webhook(request: Request):
     if not message or not sender:
         raise HTTPException(status_code=400, detail="Invalid payload")
 
-    # Process the incoming text with the agent
-    reply = process_message(message)
+    # Process the incoming text with the agent; the LLM wait stays off the blocking executor
+    reply = await aprocess_message(message)
 
-    if not (GUPSHUP_API_KEY and GUPSHUP_SOURCE):
+    if "gupshup" not in outbox.providers:
         raise HTTPException(status_code=500, detail="Gupshup not configured")
 
-    url = f"{GUPSHUP_API_BASE}/api/v1/msg"
-    headers = {"apikey": GUPSHUP_API_KEY}
-    payload = {
-        "channel": "whatsapp",
-        "source": GUPSHUP_SOURCE,
-        "destination": sender,
-        "message": reply,
-    }
-    if GUPSHUP_SRC_NAME:
-        payload["src.name"] = GUPSHUP_SRC_NAME
-    resp = requests.post(url, data=payload, headers=headers)
-    resp.raise_for_status()
-    return {"status": "ok"}
+    async with db_session() as conn:
+        message_id = await run_db(enqueue_message, conn, "gupshup", {"to": sender, "body": reply})
+    outbox.notify("gupshup")
+    return {"status": "queued", "message_id": message_id}
 
 
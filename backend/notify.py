@@ -0,0 +1,54 @@
+"""In-process wake-ups for clients waiting on new tasks."""
+
+import asyncio
+import threading
+from typing import Dict, Optional
+
+
+class TaskNotifier:
+    """Per-client events that are set whenever a task is added.
+
+    Waiters must call :meth:`event` *before* checking the database; a task
+    added after that check still sets the event they hold, so no wake-up is
+    lost. Only waiters in this process are woken, so with several server
+    processes a waiter relies on its timeout to see tasks added elsewhere.
+    """
+
+    def __init__(self) -> None:
+        self._events: Dict[str, asyncio.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def event(self, client_id: str) -> asyncio.Event:
+        """Return the event the next ``notify(client_id)`` will set."""
+        self._loop = asyncio.get_running_loop()
+        with self._lock:
+            return self._events.setdefault(client_id, asyncio.Event())
+
+    def notify(self, client_id: str) -> None:
+        """Wake all waiters for ``client_id``; safe to call from any thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._set(client_id)
+        else:
+            loop.call_soon_threadsafe(self._set, client_id)
+
+    def _set(self, client_id: str) -> None:
+        with self._lock:
+            event = self._events.pop(client_id, None)
+        if event is not None:
+            event.set()
+
+    async def wait(self, event: asyncio.Event, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds; return whether the event fired."""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
@@ -0,0 +1,258 @@
+"""Outbound WhatsApp messages sent from a persistent queue.
+
+Endpoints store a message with :func:`backend.database.enqueue_message` and
+return straight away. :class:`OutboxWorker` sends the queue per provider,
+paced by a token bucket, and retries failures with exponential backoff.
+Messages survive restarts because the queue lives in the database.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+import requests
+from twilio.base.exceptions import TwilioRestException
+from twilio.rest import Client as TwilioClient
+
+from .database import (
+    claim_messages,
+    mark_message_failed,
+    mark_message_sent,
+    next_message_due,
+)
+from .executors import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Runs a database function with a pooled connection as its first argument
+WithDb = Callable[..., Awaitable[Any]]
+
+
+class DeliveryError(Exception):
+    """A send that failed; ``retryable`` says whether trying again may help."""
+
+    def __init__(self, message: str, retryable: bool, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def _retry_after(headers) -> Optional[float]:
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Allow ``rate`` sends per second on average, in bursts of up to ``burst``."""
+
+    def __init__(self, rate: float, burst: float = 1.0) -> None:
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class TwilioProvider:
+    """Send through one Twilio REST client, created on first use."""
+
+    name = "twilio"
+
+    def __init__(
+        self,
+        account_sid: str,
+        auth_token: str,
+        from_number: str,
+        api_base: Optional[str] = None,
+        invoice_urls: Optional[Callable[[int], Awaitable[list]]] = None,
+    ) -> None:
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.api_base = api_base
+        # Resolves a queued ``voucher_id`` to media URLs when the message is sent
+        self.invoice_urls = invoice_urls
+        self._client: Optional[TwilioClient] = None
+
+    def _send(self, payload: dict) -> str:
+        if self._client is None:
+            self._client = TwilioClient(self.account_sid, self.auth_token)
+            if self.api_base:
+                self._client.api.base_url = self.api_base
+        kwargs = {
+            "from_": f"whatsapp:{self.from_number}",
+            "to": f"whatsapp:{payload['to']}",
+            "body": payload["body"],
+        }
+        if payload.get("media_url"):
+            kwargs["media_url"] = payload["media_url"]
+        return self._client.messages.create(**kwargs).sid
+
+    async def send(self, payload: dict) -> str:
+        if payload.get("voucher_id") is not None and self.invoice_urls:
+            payload = {**payload, "media_url": await self.invoice_urls(payload["voucher_id"])}
+        try:
+            return await run_blocking(self._send, payload)
+        except TwilioRestException as exc:
+            raise DeliveryError(str(exc), exc.status == 429 or exc.status >= 500)
+        except requests.RequestException as exc:
+            raise DeliveryError(str(exc), True)
+
+
+class GupshupProvider:
+    """Send through the shared async HTTP client."""
+
+    name = "gupshup"
+
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        api_base: str,
+        api_key: str,
+        source: str,
+        src_name: Optional[str] = None,
+    ) -> None:
+        self.http_client = http_client
+        self.url = f"{api_base}/api/v1/msg"
+        self.api_key = api_key
+        self.source = source
+        self.src_name = src_name
+
+    async def send(self, payload: dict) -> str:
+        data = {
+            "channel": "whatsapp",
+            "source": self.source,
+            "destination": payload["to"],
+            "message": payload["body"],
+        }
+        if self.src_name:
+            data["src.name"] = self.src_name
+        try:
+            resp = await self.http_client.post(self.url, data=data, headers={"apikey": self.api_key})
+        except httpx.HTTPError as exc:
+            raise DeliveryError(str(exc), True)
+        if resp.status_code >= 400:
+            raise DeliveryError(
+                f"HTTP {resp.status_code}: {resp.text[:200]}",
+                resp.status_code == 429 or resp.status_code >= 500,
+                _retry_after(resp.headers),
+            )
+        try:
+            return resp.json().get("messageId")
+        except ValueError:
+            return None
+
+
+class OutboxWorker:
+    """One sending loop per provider over the ``outbox`` table.
+
+    Each loop sleeps until :meth:`notify` is called for its provider or the
+    next retry is due, then claims a batch and sends it at no more than the
+    provider's rate. Failed sends are retried after ``backoff_base * 2**n``
+    seconds (capped at ``backoff_max``, and never sooner than a provider's
+    ``Retry-After``) and dead-lettered after ``max_attempts``.
+    """
+
+    def __init__(
+        self,
+        with_db: WithDb,
+        providers: Dict[str, Any],
+        rates: Dict[str, float],
+        batch_size: int = 20,
+        lease_seconds: float = 120.0,
+        max_attempts: int = 8,
+        backoff_base: float = 2.0,
+        backoff_max: float = 600.0,
+        idle_timeout: float = 60.0,
+    ) -> None:
+        self.with_db = with_db
+        self.providers = providers
+        self.buckets = {name: TokenBucket(rates[name], rates[name]) for name in providers}
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.idle_timeout = idle_timeout
+        self._wakeups = {name: asyncio.Event() for name in providers}
+        self._tasks: list[asyncio.Task] = []
+
+    def notify(self, provider: str) -> None:
+        """Wake the provider's loop, e.g. after enqueueing a message."""
+        if provider in self._wakeups:
+            self._wakeups[provider].set()
+
+    def retry_delay(self, attempts: int, retry_after: Optional[float] = None) -> float:
+        delay = min(self.backoff_base * 2 ** max(attempts - 1, 0), self.backoff_max)
+        return max(delay, retry_after or 0.0)
+
+    async def drain(self, name: str) -> int:
+        """Send every message that is due now; returns how many were attempted."""
+        provider, bucket = self.providers[name], self.buckets[name]
+        # Claim no more than can be sent well within the lease at this rate
+        limit = max(1, min(self.batch_size, int(bucket.rate * self.lease_seconds / 2)))
+        attempted = 0
+        while True:
+            batch = await self.with_db(claim_messages, name, limit, self.lease_seconds)
+            if not batch:
+                return attempted
+            for row in batch:
+                await bucket.acquire()
+                attempted += 1
+                try:
+                    provider_id = await provider.send(json.loads(row["payload"]))
+                except Exception as exc:
+                    if not isinstance(exc, DeliveryError):
+                        logger.exception("Sending message %s through %s failed", row["id"], name)
+                        exc = DeliveryError(str(exc), True)
+                    retry = exc.retryable and row["attempts"] < self.max_attempts
+                    retry_in = self.retry_delay(row["attempts"], exc.retry_after) if retry else None
+                    await self.with_db(mark_message_failed, row["id"], str(exc), retry_in)
+                    continue
+                await self.with_db(mark_message_sent, row["id"], provider_id)
+
+    async def _run(self, name: str) -> None:
+        wakeup = self._wakeups[name]
+        while True:
+            wakeup.clear()
+            try:
+                await self.drain(name)
+                due = await self.with_db(next_message_due, name)
+            except Exception:
+                logger.exception("Outbox loop for %s failed", name)
+                due = None
+            timeout = self.idle_timeout if due is None else max(0.0, due - time.time())
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run(name)) for name in self.providers]
+
+    async def close(self) -> None:
+        """Stop sending; unsent messages stay queued for the next start."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import httpx
+
+from .templates import encode_chunks, load_environment
+
+async def _aiter_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
+class AsyncTallyClient:
+    """asyncio counterpart of :class:`TallyClient`.
+
+    At most ``max_concurrency`` requests are in flight at once; Tally
+    processes requests largely serially and starts rejecting connections
+    when flooded, so the default is kept small. As with the sync client,
+    streamed bodies are sent with a Content-Length unless ``chunked=True``.
+    """
+
+    def __init__(
+        self,
+        url="http://localhost:9000",
+        template_dir=None,
+        connect_timeout=3.0,
+        read_timeout=120.0,
+        retries=3,
+        max_concurrency=4,
+        health_ttl=30.0,
+        chunked=False,
+    ):
+        self.url = url
+        self.chunked = chunked
+        self.env = load_environment(template_dir)
+        self.health_ttl = health_ttl
+        self._healthy = None
+        self._checked_at = 0.0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # httpx only retries failed connection attempts, never sent requests
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(retries=retries),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_concurrency),
+            headers={"Content-Type": "text/xml"},
+        )
+
+    def render_template(self, template_name, context):
+        template = self.env.get_template(template_name)
+        return template.render(context)
+
+    def render_stream(self, template_name, context):
+        """Yield the rendered template as encoded chunks of about 64 KiB.
+
+        Pass the result to ``post_xml``. With ``chunked=True`` large batch
+        envelopes are sent without building the whole document in memory.
+        """
+        template = self.env.get_template(template_name)
+        return encode_chunks(template.generate(context))
+
+    async def post_xml(self, xml_str):
+        """Post an XML string, or an iterable of byte chunks.
+
+        An error status raises ``httpx.HTTPStatusError``.
+        """
+        if isinstance(xml_str, str):
+            content = xml_str.encode()
+        elif self.chunked:
+            content = _aiter_chunks(xml_str)
+        else:
+            content = b"".join(xml_str)
+        async with self._semaphore:
+            try:
+                response = await self.client.post(self.url, content=content)
+            except httpx.TransportError:
+                self._set_health(False)
+                raise
+        self._set_health(True)
+        response.raise_for_status()
+        return response.text
+
+    async def is_reachable(self):
+        """Return whether Tally is up, probing at most once per ``health_ttl``."""
+        if self._healthy is not None and time.monotonic() - self._checked_at < self.health_ttl:
+            return self._healthy
+        try:
+            await self.client.get(self.url, timeout=self.client.timeout.connect)
+            ok = True
+        except httpx.HTTPError:
+            ok = False
+        self._set_health(ok)
+        return ok
+
+    def _set_health(self, ok):
+        self._healthy = ok
+        self._checked_at = time.monotonic()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
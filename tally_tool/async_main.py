@@ -0,0 +1,171 @@
+"""Async versions of the :mod:`tally_tool.main` helpers.
+
+Open a client with :func:`connect` inside your event loop, then fan out many
+Tally calls, e.g.::
+
+    async def main():
+        async with connect():
+            await asyncio.gather(*(create_ledger(name) for name in names))
+
+    asyncio.run(main())
+
+Concurrency is bounded by the shared :class:`AsyncTallyClient`.
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from .async_client import AsyncTallyClient
+from .batch import DEFAULT_BATCH_SIZE, as_ledger, chunked, failed_batch, summarize
+
+_client: ContextVar[AsyncTallyClient] = ContextVar("tally_client")
+
+
+@asynccontextmanager
+async def connect(**kwargs):
+    """Open the client the helpers below use, and close it on exit.
+
+    The httpx client is bound to the running event loop, so it is created
+    here rather than at import. ``kwargs`` go to :class:`AsyncTallyClient`;
+    ``chunked`` defaults to ``TALLY_CHUNKED`` as in :mod:`tally_tool.main`.
+    """
+    kwargs.setdefault("chunked", os.getenv("TALLY_CHUNKED", "").lower() in ("1", "true", "yes"))
+    async with AsyncTallyClient(**kwargs) as client:
+        token = _client.set(client)
+        try:
+            yield client
+        finally:
+            _client.reset(token)
+
+
+def current_client() -> AsyncTallyClient:
+    try:
+        return _client.get()
+    except LookupError:
+        raise RuntimeError("no Tally client; wrap the calls in `async with connect():`") from None
+
+
+def _write(path, data, mode="w"):
+    with open(path, mode) as f:
+        f.write(data)
+
+
+async def create_ledger(name, parent="Sundry Debtors"):
+    tally = current_client()
+    xml = tally.render_template("create_ledger.xml.j2", {"name": name, "parent": parent})
+    return await tally.post_xml(xml)
+
+async def _import_batches(template, records, batch_size, key_fields, stream=False):
+    tally = current_client()
+    async def run(offset, batch):
+        render = tally.render_stream if stream else tally.render_template
+        xml = render(template, {"records": batch})
+        return summarize(await tally.post_xml(xml), batch, offset, key_fields)
+
+    batches = list(chunked(records, batch_size))
+    results = await asyncio.gather(*(run(offset, batch) for offset, batch in batches), return_exceptions=True)
+    summaries = []
+    for (offset, batch), result in zip(batches, results):
+        if isinstance(result, Exception):
+            result = failed_batch(batch, offset, f"Tally request failed: {result}")
+        elif isinstance(result, BaseException):
+            raise result
+        summaries.append(result)
+    return summaries
+
+async def create_ledgers(ledgers, batch_size=DEFAULT_BATCH_SIZE, stream=False):
+    return await _import_batches(
+        "create_ledgers.xml.j2", (as_ledger(l) for l in ledgers), batch_size, ("name",), stream
+    )
+
+async def create_stock_items(items, batch_size=DEFAULT_BATCH_SIZE, stream=False):
+    return await _import_batches("create_stock_items.xml.j2", items, batch_size, ("name",), stream)
+
+async def import_vouchers(vouchers, batch_size=DEFAULT_BATCH_SIZE, stream=False):
+    return await _import_batches(
+        "import_vouchers.xml.j2", vouchers, batch_size, ("voucher_number", "remote_id"), stream
+    )
+
+async def export_trial_balance(from_date, to_date):
+    tally = current_client()
+    xml = tally.render_template("export_trial_balance.xml.j2", {
+        "from_date": from_date,
+        "to_date": to_date
+    })
+    response = await tally.post_xml(xml)
+    await asyncio.to_thread(_write, "trial_balance.xml", response)
+    return "Trial Balance saved to trial_balance.xml"
+
+async def create_stock_item(name, unit):
+    tally = current_client()
+    xml = tally.render_template("create_stock_item.xml.j2", {"name": name, "unit": unit})
+    return await tally.post_xml(xml)
+
+async def import_voucher(voucher_dict):
+    tally = current_client()
+    xml = tally.render_template("import_voucher.xml.j2", voucher_dict)
+    return await tally.post_xml(xml)
+
+async def fetch_report(report_name, from_date, to_date):
+    tally = current_client()
+    xml = tally.render_template("fetch_report.xml.j2", {
+        "report_name": report_name,
+        "from_date": from_date,
+        "to_date": to_date
+    })
+    response = await tally.post_xml(xml)
+    output_file = f"{report_name.replace(' ', '_').lower()}.xml"
+    await asyncio.to_thread(_write, output_file, response)
+    return f"{report_name} saved to {output_file}"
+
+async def export_voucher_xml(voucher_no, voucher_type="Sales"):
+    tally = current_client()
+    xml = tally.render_template("export_voucher_xml.xml.j2", {"voucher_no": voucher_no})
+    response = await tally.post_xml(xml)
+    await asyncio.to_thread(_write, f"voucher_{voucher_no}.xml", response)
+    return f"Voucher XML saved as voucher_{voucher_no}.xml"
+
+async def get_ledgers(min_alter_id=None):
+    tally = current_client()
+    xml = tally.render_template("get_ledgers.xml.j2", {"min_alter_id": min_alter_id})
+    return await tally.post_xml(xml)
+
+async def get_vouchers(voucher_type, from_date=None, to_date=None):
+    tally = current_client()
+    xml = tally.render_template("get_vouchers.xml.j2", {
+        "voucher_type": voucher_type,
+        "from_date": from_date,
+        "to_date": to_date
+    })
+    return await tally.post_xml(xml)
+
+async def get_specific_voucher(voucher_no, voucher_type="Sales"):
+    tally = current_client()
+    xml = tally.render_template("get_specific_voucher.xml.j2", {
+        "voucher_no": voucher_no,
+        "voucher_type": voucher_type
+    })
+    response = await tally.post_xml(xml)
+    output_file = f"specific_voucher_{voucher_no}.xml"
+    await asyncio.to_thread(_write, output_file, response)
+    return f"Specific voucher {voucher_no} saved to {output_file}"
+
+async def get_outstanding_receivables(from_date: str, to_date: str) -> str:
+    """Return the Outstanding Receivables report as XML."""
+    tally = current_client()
+    xml = tally.render_template(
+        "fetch_report.xml.j2",
+        {"report_name": "Outstanding Receivables", "from_date": from_date, "to_date": to_date},
+    )
+    return await tally.post_xml(xml)
+
+async def get_day_book(from_date: str, to_date: str) -> str:
+    """Return the Day Book report for the provided date range."""
+    tally = current_client()
+    xml = tally.render_template(
+        "fetch_report.xml.j2",
+        {"report_name": "Day Book", "from_date": from_date, "to_date": to_date},
+    )
+    return await tally.post_xml(xml)
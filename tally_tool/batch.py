@@ -0,0 +1,99 @@
+"""Helpers for packing many records into one Tally import envelope."""
+
+import io
+import re
+import xml.etree.ElementTree as ET
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from .xml_extractor import parse_import_result
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def chunked(records: Iterable[Any], size: int) -> Iterator[Tuple[int, List[Any]]]:
+    """Yield ``(offset, batch)`` pairs of at most ``size`` records."""
+    if size < 1:
+        raise ValueError("batch size must be at least 1")
+    it = iter(records)
+    offset = 0
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield offset, batch
+        offset += len(batch)
+
+
+def failed_batch(batch: Sequence[Dict[str, Any]], offset: int, error: str) -> Dict[str, Any]:
+    """Summary for a batch Tally gave no usable answer for; every record failed."""
+    return {
+        "offset": offset,
+        "count": len(batch),
+        "created": 0,
+        "altered": 0,
+        "errors": len(batch),
+        "failed": [{"index": offset + i, "record": r, "error": error} for i, r in enumerate(batch)],
+        "unmatched_errors": [],
+    }
+
+
+def _mentions(message: str, value: str) -> bool:
+    # Whole-token match, so voucher "12" is not found in "120" or "Dr: 1200"
+    pattern = r"(?<![\w-])" + re.escape(value) + r"(?![\w-])"
+    return re.search(pattern, message, re.IGNORECASE) is not None
+
+
+def summarize(
+    response: str,
+    batch: Sequence[Dict[str, Any]],
+    offset: int,
+    key_fields: Sequence[str],
+) -> Dict[str, Any]:
+    """Parse a batch import response and attribute errors to records.
+
+    Tally reports failures as free-text ``LINEERROR`` messages that echo the
+    master name or the voucher number / remote id of the offending record.
+    ``key_fields`` name those identifying fields; a message is attributed to
+    a record only if it mentions an identifier of exactly one record in the
+    batch. Everything else is returned in ``unmatched_errors``.
+    """
+    try:
+        result = parse_import_result(io.StringIO(response))
+    except ET.ParseError:
+        return failed_batch(batch, offset, "Unparseable Tally response")
+
+    failed: List[Dict[str, Any]] = []
+    unmatched: List[str] = []
+    for message in result["line_errors"]:
+        matches = [
+            i
+            for i, record in enumerate(batch)
+            if any(
+                _mentions(message, str(record[f]))
+                for f in key_fields
+                if record.get(f) not in (None, "")
+            )
+        ]
+        if len(matches) == 1:
+            i = matches[0]
+            failed.append({"index": offset + i, "record": batch[i], "error": message})
+        else:
+            unmatched.append(message)
+
+    return {
+        "offset": offset,
+        "count": len(batch),
+        "created": result["created"],
+        "altered": result["altered"],
+        "errors": result["errors"] + result["exceptions"],
+        "failed": failed,
+        "unmatched_errors": unmatched,
+    }
+
+
+def as_ledger(record: Any, parent: str = "Sundry Debtors") -> Dict[str, Any]:
+    """Accept either a ledger name or a ``{"name", "parent"}`` mapping."""
+    if isinstance(record, str):
+        return {"name": record, "parent": parent}
+    return {"parent": parent, **record}
@@ -0,0 +1,46 @@
+"""Micro-benchmark for XML template rendering.
+
+Compares the old per-call path (relative FileSystemLoader with auto_reload,
+which stats the template file on every lookup) with the precompiled
+environment used by TallyClient.
+
+    python -m tally_tool.bench_render [iterations]
+"""
+
+import sys
+import timeit
+
+from jinja2 import Environment, FileSystemLoader
+
+from .templates import TEMPLATE_DIR, load_environment
+
+CONTEXT = {
+    "vchtype": "Sales",
+    "date": "20250701",
+    "party": "ABC Enterprises",
+    "ledger_name": "Sales",
+    "is_deemed_positive": "No",
+    "amount": "10000",
+}
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    reloading = Environment(loader=FileSystemLoader(str(TEMPLATE_DIR)))
+    cached = load_environment()
+    cases = {
+        "auto_reload get_template + render": lambda: reloading.get_template(
+            "import_voucher.xml.j2"
+        ).render(CONTEXT),
+        "precompiled get_template + render": lambda: cached.get_template(
+            "import_voucher.xml.j2"
+        ).render(CONTEXT),
+    }
+    for label, fn in cases.items():
+        fn()  # warm the compile cache
+        secs = timeit.timeit(fn, number=n)
+        print(f"{label}: {secs / n * 1e6:.1f} us/render")
+
+
+if __name__ == "__main__":
+    main()
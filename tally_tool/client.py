@@ -1,17 +1,125 @@
+import threading
+import time
 
 import requests
-from jinja2 import Environment, FileSystemLoader
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .templates import encode_chunks, load_environment
 
 class TallyClient:
-    def __init__(self, url="http://localhost:9000", template_dir="xml_templates"):
+    """Render Tally XML templates and post them over a pooled HTTP session.
+
+    Connections are kept alive between calls. Connection failures are
+    retried with exponential backoff, and so are 502/503/504 responses to
+    GETs. A POST that reached Tally is never retried, whether it timed out or
+    failed with a 5xx, because Tally may already have applied the import.
+
+    Tally's HTTP server is not documented to accept ``Transfer-Encoding:
+    chunked``, so streamed bodies are joined and sent with a Content-Length
+    unless ``chunked=True``.
+    """
+
+    def __init__(
+        self,
+        url="http://localhost:9000",
+        template_dir=None,
+        connect_timeout=3.0,
+        read_timeout=120.0,
+        retries=3,
+        backoff_factor=0.5,
+        pool_size=10,
+        health_ttl=30.0,
+        chunked=False,
+    ):
         self.url = url
-        self.env = Environment(loader=FileSystemLoader(template_dir))
+        self.chunked = chunked
+        self.env = load_environment(template_dir)
+        self.timeout = (connect_timeout, read_timeout)
+        self.health_ttl = health_ttl
+        self._healthy = None
+        self._checked_at = 0.0
+        self._health_lock = threading.Lock()
+        self._health_listeners = []
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            # Status retries only; urllib3 retries connect errors for any method
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Content-Type"] = "text/xml"
 
     def render_template(self, template_name, context):
         template = self.env.get_template(template_name)
         return template.render(context)
 
+    def render_stream(self, template_name, context):
+        """Yield the rendered template as encoded chunks of about 64 KiB.
+
+        Pass the result to ``post_xml``. With ``chunked=True`` large batch
+        envelopes are sent without building the whole document in memory.
+        """
+        template = self.env.get_template(template_name)
+        return encode_chunks(template.generate(context))
+
     def post_xml(self, xml_str):
-        headers = {'Content-Type': 'text/xml'}
-        response = requests.post(self.url, data=xml_str.encode(), headers=headers)
+        """Post an XML string, or an iterable of byte chunks.
+
+        Chunks are sent with chunked transfer encoding only if the client was
+        created with ``chunked=True``. An error status raises ``HTTPError``.
+        """
+        if isinstance(xml_str, str):
+            body = xml_str.encode()
+        else:
+            body = xml_str if self.chunked else b"".join(xml_str)
+        try:
+            response = self.session.post(self.url, data=body, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            self._set_health(False)
+            raise
+        self._set_health(True)
+        response.raise_for_status()
         return response.text
+
+    def is_reachable(self):
+        """Return whether Tally is up, probing at most once per ``health_ttl``.
+
+        Successful and failed posts also refresh the cached state, so an
+        active client rarely needs a dedicated probe.
+        """
+        with self._health_lock:
+            if self._healthy is not None and time.monotonic() - self._checked_at < self.health_ttl:
+                return self._healthy
+        try:
+            self.session.get(self.url, timeout=self.timeout[0])
+            ok = True
+        except requests.RequestException:
+            ok = False
+        self._set_health(ok)
+        return ok
+
+    def add_health_listener(self, callback):
+        """Call ``callback(ok)`` whenever Tally is seen to go down or come back."""
+        self._health_listeners.append(callback)
+
+    def _set_health(self, ok):
+        with self._health_lock:
+            changed = self._healthy is not ok
+            self._healthy = ok
+            self._checked_at = time.monotonic()
+        if changed:
+            for callback in self._health_listeners:
+                callback(ok)
+
+    def close(self):
+        self.session.close()
@@ -1,15 +1,63 @@
 
 """Convenience wrappers for rendering and posting common Tally XML templates."""
 
+import os
+
+import requests
+
+from .batch import DEFAULT_BATCH_SIZE, as_ledger, chunked, failed_batch, summarize
 from .client import TallyClient
 
-tally = TallyClient()
+# Set TALLY_CHUNKED=1 only if your Tally accepts chunked request bodies
+tally = TallyClient(chunked=os.getenv("TALLY_CHUNKED", "").lower() in ("1", "true", "yes"))
 
 def create_ledger(name, parent="Sundry Debtors"):
     xml = tally.render_template("create_ledger.xml.j2", {"name": name, "parent": parent})
     response = tally.post_xml(xml)
     return response
 
+def _import_batches(template, records, batch_size, key_fields, stream=False):
+    # Stop at the first batch Tally cannot be reached for, keeping the
+    # summaries of the batches already imported
+    results = []
+    for offset, batch in chunked(records, batch_size):
+        render = tally.render_stream if stream else tally.render_template
+        xml = render(template, {"records": batch})
+        try:
+            response = tally.post_xml(xml)
+        except requests.RequestException as exc:
+            results.append(failed_batch(batch, offset, f"Tally request failed: {exc}"))
+            break
+        results.append(summarize(response, batch, offset, key_fields))
+    return results
+
+def create_ledgers(ledgers, batch_size=DEFAULT_BATCH_SIZE, stream=False):
+    """Create many ledgers, ``batch_size`` per Tally request.
+
+    ``ledgers`` may contain names or ``{"name", "parent"}`` dicts. Returns one
+    summary per batch with created/altered/error counts and failed records;
+    if Tally becomes unreachable, the summaries so far are returned with the
+    last batch marked failed. With ``stream=True`` each envelope is rendered in 64 KiB chunks, sent
+    as a chunked request body when ``TALLY_CHUNKED`` is set.
+    """
+    return _import_batches(
+        "create_ledgers.xml.j2", (as_ledger(l) for l in ledgers), batch_size, ("name",), stream
+    )
+
+def create_stock_items(items, batch_size=DEFAULT_BATCH_SIZE, stream=False):
+    """Create many ``{"name", "unit"}`` stock items, ``batch_size`` per request."""
+    return _import_batches("create_stock_items.xml.j2", items, batch_size, ("name",), stream)
+
+def import_vouchers(vouchers, batch_size=DEFAULT_BATCH_SIZE, stream=False):
+    """Import many vouchers (same fields as ``import_voucher``) in batches.
+
+    Give each voucher a unique ``voucher_number`` or ``remote_id`` so Tally's
+    error messages can be traced back to it.
+    """
+    return _import_batches(
+        "import_vouchers.xml.j2", vouchers, batch_size, ("voucher_number", "remote_id"), stream
+    )
+
 def export_trial_balance(from_date, to_date):
     xml = tally.render_template("export_trial_balance.xml.j2", {
         "from_date": from_date,
@@ -54,12 +102,26 @@ def export_voucher_xml(voucher_no, voucher_type="Sales"):
         f.write(response)
     return f"Voucher XML saved as voucher_{voucher_no}.xml"
 
-def get_ledgers():
-    xml = tally.render_template("get_ledgers.xml.j2", {})
+def get_ledgers(min_alter_id=None):
+    """Export ledgers, optionally only those altered after ``min_alter_id``."""
+    xml = tally.render_template("get_ledgers.xml.j2", {"min_alter_id": min_alter_id})
     return tally.post_xml(xml)
 
-def get_vouchers(voucher_type):
-    xml = tally.render_template("get_vouchers.xml.j2", {"voucher_type": voucher_type})
+def get_vouchers(voucher_type, from_date=None, to_date=None):
+    xml = tally.render_template("get_vouchers.xml.j2", {
+        "voucher_type": voucher_type,
+        "from_date": from_date,
+        "to_date": to_date
+    })
+    return tally.post_xml(xml)
+
+def get_vouchers_altered_since(min_alter_id, from_date=None, to_date=None):
+    """Export vouchers created or edited after ``min_alter_id``, whatever their date."""
+    xml = tally.render_template("get_altered_vouchers.xml.j2", {
+        "min_alter_id": min_alter_id,
+        "from_date": from_date,
+        "to_date": to_date
+    })
     return tally.post_xml(xml)
 
 def get_specific_voucher(voucher_no, voucher_type="Sales"):
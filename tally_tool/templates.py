@@ -0,0 +1,44 @@
+"""Shared, precompiled Jinja environment for the Tally XML templates."""
+
+from functools import lru_cache
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+TEMPLATE_DIR = Path(__file__).parent / "xml_templates"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=None)
+def load_environment(template_dir=None):
+    """Return an environment with every template already compiled.
+
+    Environments are cached per directory and ``auto_reload`` is off, so
+    rendering never touches the filesystem after the first call. Values are
+    XML-escaped, so a name such as "Sharma & Sons" cannot break an envelope.
+    """
+    env = Environment(
+        loader=FileSystemLoader(str(template_dir or TEMPLATE_DIR)),
+        auto_reload=False,
+        cache_size=-1,
+        autoescape=select_autoescape(["j2"]),
+    )
+    for name in env.list_templates(extensions=["j2"]):
+        env.get_template(name)
+    return env
+
+
+def encode_chunks(fragments, size=STREAM_CHUNK_SIZE):
+    """Encode rendered template fragments into chunks of about ``size`` bytes.
+
+    ``Template.generate`` yields many tiny strings; sending each one as its
+    own chunk would mean thousands of small writes per envelope.
+    """
+    buffer = bytearray()
+    for fragment in fragments:
+        buffer += fragment.encode()
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
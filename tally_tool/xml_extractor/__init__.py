@@ -0,0 +1,23 @@
+"""Streaming extractors for Tally XML responses."""
+
+from .stream import (
+    iter_elements,
+    iter_ledgers,
+    iter_vouchers,
+    ledger_record,
+    parse_import_result,
+    parse_response,
+    strip_invalid_char_refs,
+    voucher_record,
+)
+
+__all__ = [
+    "iter_elements",
+    "iter_ledgers",
+    "iter_vouchers",
+    "ledger_record",
+    "parse_import_result",
+    "parse_response",
+    "strip_invalid_char_refs",
+    "voucher_record",
+]
@@ -0,0 +1,75 @@
+"""Command line interface for the streaming Tally XML extractors.
+
+Usage::
+
+    python -m tally_tool.xml_extractor vouchers daybook.xml [--items]
+    python -m tally_tool.xml_extractor ledgers trial_balance.xml
+    python -m tally_tool.xml_extractor response import_result.xml
+"""
+
+import argparse
+import sys
+
+from .stream import iter_ledgers, iter_vouchers, parse_response
+
+
+def print_vouchers(path: str, items: bool) -> None:
+    for v in iter_vouchers(path):
+        print(
+            f"- No: {v['number']}, Date: {v['date']}, Type: {v['type']}, "
+            f"Party: {v['party']}, Amount: {v['amount']}"
+        )
+        if items:
+            for inv in v["items"]:
+                print(
+                    f"    {inv['item']}: Qty={inv['qty']}, Rate={inv['rate']}, "
+                    f"Amount={inv['amount']}"
+                )
+
+
+def print_ledgers(path: str) -> None:
+    for l in iter_ledgers(path):
+        line = f"- {l['name']} (Group: {l['group']})"
+        if l["closing_balance"] is not None:
+            line += f": Closing Balance = {l['closing_balance']}"
+        print(line)
+
+
+def print_response(path: str) -> int:
+    counts = parse_response(path)
+    if counts is None:
+        print("No <RESPONSE> found in XML.")
+        return 1
+    print(
+        "Created: {created}, Altered: {altered}, Deleted: {deleted}, "
+        "Errors: {errors}, Exceptions: {exceptions}".format(**counts)
+    )
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Extract records from Tally XML")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    vouchers = sub.add_parser("vouchers", help="List vouchers in an export")
+    vouchers.add_argument("xml_file")
+    vouchers.add_argument("--items", action="store_true", help="Include inventory entries")
+
+    ledgers = sub.add_parser("ledgers", help="List ledgers in an export")
+    ledgers.add_argument("xml_file")
+
+    response = sub.add_parser("response", help="Show import result counters")
+    response.add_argument("xml_file")
+
+    args = parser.parse_args(argv)
+    if args.command == "vouchers":
+        print_vouchers(args.xml_file, args.items)
+    elif args.command == "ledgers":
+        print_ledgers(args.xml_file)
+    else:
+        return print_response(args.xml_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
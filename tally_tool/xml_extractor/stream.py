@@ -0,0 +1,147 @@
+"""Incremental parsing of Tally XML exports.
+
+Day Book and voucher exports can run to hundreds of megabytes, so the helpers
+here use ``iterparse`` and detach every element once it has been handled.
+Memory use therefore depends on the size of a single record, not the export.
+"""
+
+import re
+import xml.etree.ElementTree as ET
+from typing import IO, Any, Dict, Iterator, Optional, Union
+
+Source = Union[str, IO[Any]]
+
+RESPONSE_FIELDS = ("CREATED", "ALTERED", "DELETED", "ERRORS", "EXCEPTIONS")
+
+
+_CHAR_REF = re.compile(r"&#(?:x([0-9a-fA-F]+)|([0-9]+));")
+
+
+def _valid_xml_char(code: int) -> bool:
+    return (
+        code in (0x9, 0xA, 0xD)
+        or 0x20 <= code <= 0xD7FF
+        or 0xE000 <= code <= 0xFFFD
+        or 0x10000 <= code <= 0x10FFFF
+    )
+
+
+def strip_invalid_char_refs(text: str) -> str:
+    """Remove character references that are not allowed in XML 1.0.
+
+    Tally writes control characters from narrations and names as references
+    such as ``&#4;``, which every XML parser rejects.
+    """
+    if "&#" not in text:
+        return text
+
+    def replace(match: re.Match) -> str:
+        hex_code, dec_code = match.groups()
+        code = int(hex_code, 16) if hex_code else int(dec_code)
+        return match.group(0) if _valid_xml_char(code) else ""
+
+    return _CHAR_REF.sub(replace, text)
+
+
+def iter_elements(source: Source, tag: str) -> Iterator[ET.Element]:
+    """Yield each complete ``tag`` element from ``source`` one at a time.
+
+    Elements are removed from the tree after they are yielded, so callers
+    must copy out anything they need before advancing the iterator.
+    """
+    stack: list[ET.Element] = []
+    inside = 0
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if elem.tag == tag:
+                inside += 1
+            continue
+
+        stack.pop()
+        if elem.tag == tag:
+            inside -= 1
+            if inside == 0:
+                yield elem
+        if inside == 0 and stack:
+            # Finished with this subtree: detach it so it can be collected.
+            stack[-1].remove(elem)
+
+
+def _text(elem: ET.Element, path: str) -> Optional[str]:
+    value = elem.findtext(path)
+    return value.strip() if value is not None else None
+
+
+def voucher_record(voucher: ET.Element) -> Dict[str, Any]:
+    """Convert a ``VOUCHER`` element into a plain dictionary."""
+    items = [
+        {
+            "item": _text(inv, "STOCKITEMNAME"),
+            "qty": _text(inv, "BILLEDQTY"),
+            "rate": _text(inv, "RATE"),
+            "amount": _text(inv, "AMOUNT"),
+        }
+        for inv in voucher.iterfind(".//ALLINVENTORYENTRIES.LIST")
+    ]
+    return {
+        "number": _text(voucher, "VOUCHERNUMBER"),
+        "date": _text(voucher, "DATE"),
+        "type": _text(voucher, "VOUCHERTYPENAME") or voucher.get("VCHTYPE"),
+        "party": _text(voucher, "PARTYLEDGERNAME"),
+        "amount": _text(voucher, "AMOUNT"),
+        "alter_id": _text(voucher, "ALTERID"),
+        "items": items,
+    }
+
+
+def ledger_record(ledger: ET.Element) -> Dict[str, Any]:
+    """Convert a ``LEDGER`` element into a plain dictionary."""
+    return {
+        "name": ledger.get("NAME") or _text(ledger, "NAME"),
+        "group": _text(ledger, "PARENT"),
+        "closing_balance": _text(ledger, "CLOSINGBALANCE"),
+        "alter_id": _text(ledger, "ALTERID"),
+    }
+
+
+def iter_vouchers(source: Source) -> Iterator[Dict[str, Any]]:
+    """Yield voucher records from a Day Book or voucher export."""
+    for voucher in iter_elements(source, "VOUCHER"):
+        yield voucher_record(voucher)
+
+
+def iter_ledgers(source: Source) -> Iterator[Dict[str, Any]]:
+    """Yield ledger records from a ledger list or trial balance export."""
+    for ledger in iter_elements(source, "LEDGER"):
+        yield ledger_record(ledger)
+
+
+def parse_response(source: Source) -> Optional[Dict[str, int]]:
+    """Return the import counters from a Tally ``RESPONSE`` block.
+
+    Returns ``None`` if the document has no ``RESPONSE`` element.
+    """
+    for resp in iter_elements(source, "RESPONSE"):
+        counts = {}
+        for field in RESPONSE_FIELDS:
+            value = _text(resp, field)
+            counts[field.lower()] = int(value) if value else 0
+        return counts
+    return None
+
+
+def parse_import_result(source: Source) -> Dict[str, Any]:
+    """Return import counters plus any ``LINEERROR`` messages.
+
+    Unlike :func:`parse_response` this always returns a dictionary; missing
+    counters are reported as zero.
+    """
+    result: Dict[str, Any] = {field.lower(): 0 for field in RESPONSE_FIELDS}
+    result["line_errors"] = []
+    for _, elem in ET.iterparse(source):
+        if elem.tag in RESPONSE_FIELDS and elem.text and elem.text.strip().isdigit():
+            result[elem.tag.lower()] = int(elem.text)
+        elif elem.tag == "LINEERROR" and elem.text:
+            result["line_errors"].append(elem.text.strip())
+    return result
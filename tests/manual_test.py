@@ -1,5 +1,5 @@
 import sys
-from agent.tally_agent import process_message, queue
+from agent.tally_agent import process_message, runtime
 
 
 def main() -> None:
@@ -10,9 +10,9 @@ def main() -> None:
         return
     response = process_message(user_text)
     print(response)
-    pending = queue.get_pending()
+    pending = runtime.queue.count()
     if pending:
-        print(f"Queued XML count: {len(pending)}")
+        print(f"Queued XML count: {pending}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+"""Batch import envelopes and the per-record summary of Tally's answer."""
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from tally_tool.batch import as_ledger, summarize
+from tally_tool.templates import encode_chunks, load_environment
+
+VOUCHERS = [
+    {
+        "vchtype": "Sales",
+        "date": "20260401",
+        "party": party,
+        "ledger_name": "Sales & Services",
+        "is_deemed_positive": "No",
+        "amount": 100 + n,
+        "voucher_number": str(n),
+    }
+    for n, party in enumerate(["Acme Traders", "Sharma & Sons", "R&D <Labs>", "Acme Traders"], start=1)
+]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_names_with_markup_characters_keep_the_envelope_valid(stream):
+    template = load_environment().get_template("import_vouchers.xml.j2")
+    if stream:
+        xml = b"".join(encode_chunks(template.generate(records=VOUCHERS), size=64)).decode()
+    else:
+        xml = template.render(records=VOUCHERS)
+
+    vouchers = ET.fromstring(xml).findall(".//VOUCHER")
+    assert [v.findtext("PARTYLEDGERNAME") for v in vouchers] == [v["party"] for v in VOUCHERS]
+    assert {v.findtext("ALLLEDGERENTRIES.LIST/LEDGERNAME") for v in vouchers} == {"Sales & Services"}
+
+
+def test_ledger_batch_escapes_names():
+    ledgers = [as_ledger(name) for name in ["Sharma & Sons", 'Gupta "Steel"', "Plain"]]
+    xml = load_environment().get_template("create_ledgers.xml.j2").render(records=ledgers)
+
+    names = [ledger.get("NAME") for ledger in ET.fromstring(xml).iter("LEDGER")]
+    assert names == ["Sharma & Sons", 'Gupta "Steel"', "Plain"]
+
+
+def test_errors_are_attributed_only_to_a_unique_voucher():
+    response = """<RESPONSE><CREATED>2</CREATED><ERRORS>2</ERRORS>
+    <LINEERROR>Voucher Number: 2 Ledger 'Sharma &amp; Sons' does not exist!</LINEERROR>
+    <LINEERROR>Ledger 'Acme Traders' does not exist!</LINEERROR></RESPONSE>"""
+
+    result = summarize(response, VOUCHERS, 100, ("voucher_number", "remote_id"))
+
+    assert [(f["index"], f["record"]["party"]) for f in result["failed"]] == [(101, "Sharma & Sons")]
+    # Two vouchers are for Acme Traders and the message names no voucher number
+    assert result["unmatched_errors"] == ["Ledger 'Acme Traders' does not exist!"]
+    assert (result["created"], result["errors"]) == (2, 2)
@@ -0,0 +1,48 @@
+"""The rule-based intent parser against the labeled corpus in ``agent/intent_corpus.jsonl``."""
+
+import pytest
+
+from agent.bench_intent import at_threshold, evaluate, key_fields, load
+from agent.tally_agent import INTENT_MIN_CONFIDENCE
+from agent.utils.intent import parse_intent
+
+ROWS = load()
+RESULTS = evaluate(ROWS)
+ANSWERED = [r for r in RESULTS if r[2] is not None and r[3] >= INTENT_MIN_CONFIDENCE]
+
+
+@pytest.mark.parametrize("result", ANSWERED, ids=[r[0]["text"] for r in ANSWERED])
+def test_answers_above_the_threshold_match_the_labels(result):
+    row, _, intent, _, _ = result
+    assert row["expected"] is not None, "answered a command the rules should leave to the LLM"
+    # Task, date range, party and company all have to agree
+    assert key_fields(intent) == key_fields(row["expected"])
+
+
+def test_threshold_only_admits_fully_understood_commands():
+    in_scope = sum(row["expected"] is not None for row in ROWS)
+    counts = at_threshold(RESULTS, INTENT_MIN_CONFIDENCE)
+    assert counts["wrong"] == 0
+    assert counts["correct"] / in_scope >= 0.85
+    # Allowing one unknown word (confidence 0.7) answers "ledger balance of ..." wrongly
+    assert at_threshold(RESULTS, 0.7)["wrong"] > 0
+
+
+@pytest.mark.parametrize(
+    "text, party",
+    [
+        ("outstanding for Acme Traders for 2026-09-01 to 2026-09-30", "Acme Traders"),
+        ("payables to Gupta Steel as of 2026-10-18", "Gupta Steel"),
+        ("receivables of Acme for FY 2025-26", "Acme"),
+        ("ledger of Sharma & Sons from 2026-04-01 to 2026-06-30", "Sharma & Sons"),
+    ],
+)
+def test_party_excludes_the_date_prepositions(text, party):
+    intent, confidence = parse_intent(text)
+    assert intent["parameters"]["filters"]["party"] == party
+    assert confidence == 1.0
+
+
+@pytest.mark.parametrize("text", ["day book not for march 2026", "don't show ledgers", "receivables except Acme"])
+def test_negated_commands_are_left_to_the_llm(text):
+    assert parse_intent(text) == (None, 0.0)
@@ -0,0 +1,120 @@
+"""``process_message`` with a stub LLM: date rewriting, fast path, cache and batching."""
+
+import asyncio
+import json
+import threading
+from datetime import date
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from agent import tally_agent
+from agent.utils.dates import resolve_relative_dates
+from agent.utils.llm_cache import LLMCache
+
+ANSWER = {"root_task": "Reports", "sub_task": "GST Summary", "parameters": {}}
+
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    runtime = tally_agent.AgentRuntime(queue_path=str(tmp_path / "queue.db"))
+    prompts = []
+
+    def llm(inputs):
+        prompts.append(inputs["user_input"])
+        return json.dumps(ANSWER)
+
+    runtime._chain = RunnableLambda(llm)
+    runtime._llm_cache = LLMCache(tmp_path / "cache.db", version="test")
+    uploads = []
+    monkeypatch.setattr(tally_agent, "runtime", runtime)
+    monkeypatch.setattr(tally_agent, "backend_post", lambda route, data: uploads.append(data))
+    yield runtime, prompts, uploads
+    if runtime._llm_batcher is not None:
+        runtime._llm_batcher.close()
+    runtime._llm_cache.close()
+
+
+def test_repeated_commands_are_answered_from_the_cache(agent):
+    runtime, prompts, uploads = agent
+
+    first = tally_agent.process_message("GST summary of Today Traders since yesterday")
+    second = tally_agent.process_message("  GST SUMMARY of Today Traders  since yesterday! ")
+
+    assert json.loads(first) == json.loads(second) == ANSWER
+    yesterday = date.fromordinal(date.today().toordinal() - 1).isoformat()
+    assert prompts == [f"GST summary of Today Traders since {yesterday}"]
+    assert runtime.llm_cache.stats()["hits"] == 1
+    assert [u["payload"] for u in uploads] == [first, second]
+
+
+def test_common_commands_skip_the_llm(agent):
+    runtime, prompts, _ = agent
+
+    result = json.loads(tally_agent.process_message("Day book for today"))
+
+    today = date.today().isoformat()
+    assert result["sub_task"] == "Day Book"
+    assert result["parameters"]["date_range"] == {"from": today, "to": today}
+    assert prompts == []
+    assert runtime._llm_batcher is None
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Outstanding of Today Traders", "Outstanding of Today Traders"),
+        ("Today Traders ledger for today", "Today Traders ledger for 2026-10-18"),
+        ("today's day book", "2026-10-18 day book"),
+        ("sales as of yesterday", "sales as of 2026-10-17"),
+    ],
+)
+def test_today_is_only_rewritten_where_a_date_is_expected(text, expected):
+    assert resolve_relative_dates(text, date(2026, 10, 18)) == expected
+
+
+def test_eviction_runs_every_few_puts(tmp_path):
+    cache = LLMCache(tmp_path / "cache.db", max_entries=3, evict_every=5)
+    try:
+        for n in range(4):
+            cache.put(f"command {n}", "answer")
+        assert cache.stats()["entries"] == 4
+        cache.put("command 4", "answer")
+        assert cache.stats()["entries"] == 3
+        # The least recently stored were evicted
+        assert cache.get("command 0") is None
+        assert cache.get("command 4") == "answer"
+    finally:
+        cache.close()
+
+
+def test_slow_llm_gets_the_busy_reply(agent, monkeypatch):
+    runtime, _, uploads = agent
+    release = threading.Event()
+    runtime._chain = RunnableLambda(lambda inputs: release.wait(5) and json.dumps(ANSWER))
+    monkeypatch.setattr(tally_agent, "LLM_MAX_LATENCY", 0.2)
+
+    try:
+        assert tally_agent.process_message("GST summary for Acme") == tally_agent.BUSY_REPLY
+        assert asyncio.run(tally_agent.aprocess_message("GST summary for Beta")) == tally_agent.BUSY_REPLY
+    finally:
+        release.set()
+    assert uploads == []
+    assert runtime.llm_cache.get("GST summary for Acme") is None
+
+
+def test_async_messages_share_the_batcher_and_cache(agent, monkeypatch):
+    runtime, prompts, uploads = agent
+    monkeypatch.setenv("LLM_BATCH_WAIT", "0.5")
+
+    async def burst():
+        return await asyncio.gather(
+            *(tally_agent.aprocess_message(f"GST summary for party {n}") for n in range(4))
+        )
+
+    assert [json.loads(r) for r in asyncio.run(burst())] == [ANSWER] * 4
+    assert sorted(prompts) == [f"GST summary for party {n}" for n in range(4)]
+    assert runtime.llm_batcher.stats()["batches"] == 1
+    assert asyncio.run(tally_agent.aprocess_message("GST summary for party 0")) == json.dumps(ANSWER)
+    assert len(prompts) == 4
+    assert len(uploads) == 5
@@ -0,0 +1,172 @@
+"""The outbound message queue driven against ``backend.fake_provider``.
+
+The fake provider is mounted in-process through ``httpx.ASGITransport``, so
+no server or network access is needed.
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from backend import database, fake_provider
+from backend.outbox import GupshupProvider, OutboxWorker, TokenBucket
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    database.init_db(tmp_path / "outbox.db").close()
+    return tmp_path / "outbox.db"
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    monkeypatch.setattr(fake_provider, "FAIL_RATE", 0.0)
+    monkeypatch.setattr(fake_provider, "MAX_RATE", 0.0)
+    monkeypatch.setattr(fake_provider, "LATENCY", 0.0)
+    fake_provider.sent.clear()
+    fake_provider._recent.clear()
+    return fake_provider
+
+
+def run(db_path, body, rate=50.0, **worker_kwargs):
+    """Run ``body(worker)`` with a worker sending Gupshup messages to the fake provider."""
+    conn = database.connect(db_path)
+
+    async def with_db(func, *args):
+        return func(conn, *args)
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_provider.app))
+        provider = GupshupProvider(client, "http://fake", "key", "9100000000")
+        worker = OutboxWorker(with_db, {"gupshup": provider}, {"gupshup": rate}, **worker_kwargs)
+        try:
+            return await body(worker)
+        finally:
+            await worker.close()
+            await client.aclose()
+
+    try:
+        return asyncio.run(main())
+    finally:
+        conn.close()
+
+
+def enqueue(db_path, count):
+    conn = database.connect(db_path)
+    try:
+        return [
+            database.enqueue_message(conn, "gupshup", {"to": f"91{n:010d}", "body": f"message {n}"})
+            for n in range(count)
+        ]
+    finally:
+        conn.close()
+
+
+def statuses(db_path):
+    conn = database.connect(db_path)
+    try:
+        return {row["id"]: dict(row) for row in conn.execute("SELECT id, status, attempts, last_error FROM outbox")}
+    finally:
+        conn.close()
+
+
+async def wait_until_settled(db_path, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(m["status"] in ("sent", "dead") for m in statuses(db_path).values()):
+            return
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"outbox not settled: {statuses(db_path)}")
+
+
+def test_token_bucket_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_sends_are_paced_to_the_provider_rate(db_path, fake):
+    # The provider throttles above 40/s; bursts of 20 plus 20/s stay under it
+    fake.MAX_RATE = 40
+    enqueue(db_path, 50)
+
+    async def drain(worker):
+        started = time.monotonic()
+        attempted = await worker.drain("gupshup")
+        return attempted, time.monotonic() - started
+
+    attempted, elapsed = run(db_path, drain, rate=20.0)
+
+    assert attempted == 50
+    # 20 go out in the first burst, the other 30 at 20 per second
+    assert elapsed >= 1.4
+    messages = statuses(db_path).values()
+    assert all(m["status"] == "sent" and m["attempts"] == 1 for m in messages)
+    assert len(fake.sent) == 50
+
+
+def test_failures_are_retried_with_backoff_then_dead_lettered(db_path, fake):
+    fake.FAIL_RATE = 1.0
+    [message_id] = enqueue(db_path, 1)
+
+    async def send(worker):
+        worker.start()
+        await wait_until_settled(db_path)
+
+    started = time.monotonic()
+    run(db_path, send, backoff_base=0.05, max_attempts=3)
+
+    message = statuses(db_path)[message_id]
+    assert message["status"] == "dead"
+    assert message["attempts"] == 3
+    assert "503" in message["last_error"]
+    # Waited 0.05 s then 0.1 s between the three attempts
+    assert time.monotonic() - started >= 0.15
+    assert fake.sent == []
+
+
+def test_throttled_sends_wait_for_retry_after(db_path, fake):
+    # One request per second; the second message gets a 429 with Retry-After: 1
+    fake.MAX_RATE = 1
+    ids = enqueue(db_path, 2)
+
+    async def send(worker):
+        await worker.drain("gupshup")
+        conn = database.connect(db_path)
+        try:
+            due = database.next_message_due(conn, "gupshup")
+        finally:
+            conn.close()
+        return due
+
+    due = run(db_path, send, backoff_base=0.01)
+
+    messages = statuses(db_path)
+    assert messages[ids[0]]["status"] == "sent"
+    assert messages[ids[1]]["status"] == "pending"
+    assert "429" in messages[ids[1]]["last_error"]
+    assert due - time.time() > 0.5
+
+
+def test_queue_survives_a_restart(db_path, fake):
+    ids = enqueue(db_path, 5)
+    # A previous process leased two messages and died before sending them
+    conn = database.connect(db_path)
+    try:
+        leased = database.claim_messages(conn, "gupshup", 2, lease_seconds=0.2)
+    finally:
+        conn.close()
+    assert [row["id"] for row in leased] == ids[:2]
+
+    async def send(worker):
+        worker.start()
+        await wait_until_settled(db_path)
+
+    run(db_path, send)
+
+    messages = statuses(db_path)
+    assert all(m["status"] == "sent" for m in messages.values())
+    # The leased ones were picked up again once their lease ran out
+    assert [messages[i]["attempts"] for i in ids] == [2, 2, 1, 1, 1]
+    assert sorted(m["message"] for m in fake.sent) == [f"message {n}" for n in range(5)]